@@ -0,0 +1,25 @@
+import statistics, sys
+
+
+class Report():
+    """Summaries of benchmark timings and their comparison with a baseline"""
+    @staticmethod
+    def summary(values: list[float]) -> dict:
+        """Median and minimum of the timings of a benchmark"""
+        return dict(median=round(statistics.median(values), 4), min=round(min(values), 4))
+
+    @staticmethod
+    def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+        """Benchmarks whose median is more than tolerance slower than in the baseline
+        args: results, baseline = {benchmark: summary()}, other keys are ignored
+        """
+        slower: list[str] = []
+        for name, summary in results.items():
+            if not isinstance(summary, dict) or "median" not in summary or name not in baseline:
+                continue
+            before: float = baseline[name]["median"]
+            change: float = summary["median"] / before - 1 if before else 0
+            print(f"{name}: {before:.3f}s -> {summary['median']:.3f}s ({change:+.0%})", file=sys.stderr)
+            if change > tolerance:
+                slower.append(name)
+        return slower
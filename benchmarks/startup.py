@@ -0,0 +1,103 @@
+import argparse, json, os, subprocess, sys, tempfile, time
+from report import Report
+
+SRC: str = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src")
+# modules that should only be loaded on first use
+LAZY_MODULES: list[str] = ["asyncio", "mutagen", "PySide6.QtMultimedia"]
+
+
+class StartupBenchmark():
+    """Cold start of the app in fresh processes
+    import = seconds to import audiobookEncoder
+    first_paint = seconds from the first import until the main window is painted
+    process = seconds from starting python until the main window is painted
+    args: runs = measured processes
+          books = synthetic audiobooks in the library
+    """
+    def __init__(self, runs: int = 5, books: int = 0) -> None:
+        self.runs: int = runs
+        self.books: int = books
+
+    def library(self, path: str) -> None:
+        """Write a library of books audiobooks with missing files"""
+        sys.path.insert(0, SRC)
+        from library import LibraryStore
+        LibraryStore(path).write_books({f"audiobook_{index}": dict(
+            title=f"Audiobook {index}", author="Author", genre="Audiobook", cover="",
+            tracknumber=[1, 1], duration=36000, destination="", quality=2, export=True,
+            files=[dict(file=f"/missing/{index}/{track}.mp3", duration=3600) for track in range(10)])
+            for index in range(self.books)})
+
+    def run(self) -> dict:
+        """Median and minimum of each timing over all runs"""
+        samples: list[dict] = []
+        with tempfile.TemporaryDirectory() as folder:
+            library: str = f"{folder}/audiobooks.db"
+            self.library(library)
+            for _ in range(self.runs):
+                started: float = time.perf_counter()
+                output: str = subprocess.run([sys.executable, os.path.realpath(__file__), "--child", library],
+                                             capture_output=True, text=True, check=True).stdout
+                sample: dict = json.loads(output.splitlines()[-1])
+                sample.update({"process": time.perf_counter() - started})
+                samples.append(sample)
+        results: dict = dict(python=sys.version.split()[0], runs=self.runs, books=self.books,
+                             lazy_modules_loaded=samples[-1]["modules"])
+        for timing in ["import", "first_paint", "process"]:
+            results.update({timing: Report.summary([e[timing] for e in samples])})
+        return results
+
+    @staticmethod
+    def child(library: str) -> None:
+        """Start the app, print its timings once the main window is painted and quit"""
+        started: float = time.perf_counter()
+        sys.path.insert(0, SRC)
+        import audiobookEncoder
+        imported: float = time.perf_counter()
+        from PySide6.QtCore import QObject, QEvent
+        from PySide6.QtWidgets import QApplication
+        from library import Library
+
+        class FirstPaint(QObject):
+            def eventFilter(self, watched: QObject, event: QEvent) -> bool:
+                if event.type() == QEvent.Paint:
+                    print(json.dumps({"import": imported - started,
+                                      "first_paint": time.perf_counter() - started,
+                                      "modules": [e for e in LAZY_MODULES if e in sys.modules]}), flush=True)
+                    app.quit()
+                return False
+
+        app: QApplication = QApplication(sys.argv[:1])
+        Library.instance(library)
+        window: audiobookEncoder.AudiobookEncoderMainWindow = audiobookEncoder.AudiobookEncoderMainWindow()
+        first_paint: FirstPaint = FirstPaint()
+        window.installEventFilter(first_paint)
+        window.show()
+        app.exec()
+
+
+def main() -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Startup time of the app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--books", type=int, default=0, help="synthetic audiobooks in the library")
+    parser.add_argument("--output", help="write the results as json")
+    parser.add_argument("--baseline", help="results of an earlier release to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args: argparse.Namespace = parser.parse_args()
+    if args.child:
+        StartupBenchmark.child(args.child)
+        return 0
+    results: dict = StartupBenchmark(args.runs, args.books).run()
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            if Report.compare(results, json.load(baseline_file), args.tolerance):
+                return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import argparse, glob, json, os, subprocess, sys, tempfile, time
+from report import Report
+from synthetic import SyntheticLibrary
+
+SRC: str = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src")
+
+
+class BenchmarkSuite():
+    """Time the subsystems of the app on a synthetic library
+    import = Audiobook.get_data of every book folder with empty caches
+    split = Audiobook.split_audiobooks with parts of about 40% of the longest book
+    json = JsonIO round-trip of the library
+    sqlite = LibraryStore round-trip of the library
+    tree = LibraryModel over the library, expanding every book
+    export = Audiobook.export_pool of all books with the stub encoder
+    Every run is a fresh process with its own library, cover store and probe cache.
+    args: library = synthetic library of the benchmarks
+          runs = measured runs of every benchmark
+    """
+    benchmarks: list[str] = ["import", "split", "json", "sqlite", "tree", "export"]
+
+    def __init__(self, library: SyntheticLibrary, runs: int = 3) -> None:
+        self.library: SyntheticLibrary = library
+        self.runs: int = runs
+
+    def run(self, benchmarks: list[str]) -> dict:
+        """Summary of every benchmark and the settings it ran with"""
+        results: dict = dict(python=sys.version.split()[0], runs=self.runs,
+                             books=self.library.books, tracks=self.library.tracks,
+                             duration=self.library.duration, cover_size=self.library.cover_size)
+        with tempfile.TemporaryDirectory() as folder:
+            self.library.write(f"{folder}/library")
+            for name in benchmarks:
+                seconds: list[float] = []
+                for run in range(self.runs):
+                    work: str = f"{folder}/{name}_{run}"
+                    os.makedirs(work)
+                    output: str = subprocess.run([sys.executable, os.path.realpath(__file__), "--child", name,
+                                                  f"{folder}/library", work],
+                                                 capture_output=True, text=True, check=True).stdout
+                    seconds.append(json.loads(output.splitlines()[-1])["seconds"])
+                results.update({name: Report.summary(seconds)})
+                print(f"{name}: {results[name]['median']:.3f}s", file=sys.stderr)
+        return results
+
+    @staticmethod
+    def child(name: str, library: str, work: str) -> float:
+        """Seconds of a single benchmark run, setup is not timed"""
+        sys.path.insert(0, SRC)
+        from PySide6.QtCore import QCoreApplication, QUrl, Qt
+        from audiobook import Audiobook
+        from coverstore import CoverStore
+        from encoders import StubEncoder
+        from jsonio import JsonIO
+        from library import Library, LibraryStore
+        from models import LibraryModel
+        from probecache import ProbeCache
+        # kept by Qt for the whole timed run, audiobooks and the tree model need an application
+        QCoreApplication(sys.argv[:1])
+        Library.instance(f"{work}/audiobooks.db")
+        CoverStore.instance(f"{work}/covers")
+        ProbeCache.instance(f"{work}/probecache.json")
+        folders: list[str] = sorted(glob.glob(f"{library}/book_*"))
+
+        def import_books() -> None:
+            for folder in folders:
+                Audiobook().get_data([QUrl.fromLocalFile(folder)])
+
+        started: float = time.perf_counter()
+        if name == "import":
+            import_books()
+            return time.perf_counter() - started
+        import_books()
+        audiobook: Audiobook = Audiobook()
+        data: dict = audiobook.read_data()
+        if name == "split":
+            audiobook.max_duration = max(1, round(max(e["duration"] for e in data.values()) * 0.4))
+            started = time.perf_counter()
+            audiobook.split_audiobooks()
+        elif name == "json":
+            started = time.perf_counter()
+            JsonIO.write(data, f"{work}/audiobooks.json")
+            JsonIO.read(f"{work}/audiobooks.json")
+        elif name == "sqlite":
+            store: LibraryStore = LibraryStore(f"{work}/copy.db")
+            started = time.perf_counter()
+            store.write_books(data)
+            store.read_books()
+        elif name == "tree":
+            started = time.perf_counter()
+            model: LibraryModel = LibraryModel(audiobook.read_data(files=False))
+            for row in range(model.rowCount()):
+                book = model.index(row, 0)
+                model.data(book, LibraryModel.BookRole)
+                model.data(model.index(row, 1), Qt.DisplayRole)
+                model.fetchMore(book)
+                for track in range(model.rowCount(book)):
+                    model.data(model.index(track, 0, book), Qt.DisplayRole)
+        elif name == "export":
+            os.makedirs(f"{work}/export")
+            for key in data:
+                audiobook.update_data(key, {"destination": f"{work}/export"})
+            audiobook.encoder = StubEncoder(realtime=0)
+            started = time.perf_counter()
+            audiobook.export()
+            if audiobook.export_thread is not None:
+                audiobook.export_thread.join()
+        return time.perf_counter() - started
+
+
+def main() -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="Time import, split, persistence, tree and export on a synthetic library")
+    parser.add_argument("--only", nargs="+", choices=BenchmarkSuite.benchmarks, help="benchmarks to run, default all")
+    parser.add_argument("--books", type=int, default=10)
+    parser.add_argument("--tracks", type=int, default=10, help="mp3s per book")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per mp3")
+    parser.add_argument("--cover-size", type=int, default=600, help="edge of the cover art in pixels")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="write the results as json")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args: argparse.Namespace = parser.parse_args()
+    if args.child:
+        print(json.dumps(dict(seconds=BenchmarkSuite.child(*args.child))), flush=True)
+        return 0
+    library: SyntheticLibrary = SyntheticLibrary(args.books, args.tracks, args.duration, args.cover_size)
+    results: dict = BenchmarkSuite(library, args.runs).run(args.only or BenchmarkSuite.benchmarks)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            if Report.compare(results, json.load(baseline_file), args.tolerance):
+                return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
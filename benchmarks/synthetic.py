@@ -0,0 +1,63 @@
+import os, struct, zlib
+from mutagen.id3 import ID3, TALB, TPE1, TIT2, TRCK, APIC
+
+
+class SyntheticLibrary():
+    """Folders of silent mp3s with ID3 tags and cover art, written without network or encoder
+    Every book is a folder of tracks, the first track of a book has an APIC cover.
+    Files are the same on every run for the same arguments.
+    args: books = number of book folders
+          tracks = mp3s per book
+          duration = seconds per track
+          cover_size = edge of the square PNG covers in pixels
+    """
+    # MPEG-1 layer III, 128 kbit/s, 44.1 kHz, 417 bytes of silence per 1152 samples
+    frame: bytes = b"\xff\xfb\x90\x64" + bytes(413)
+    samples_per_frame: int = 1152
+    sample_rate: int = 44100
+
+    def __init__(self, books: int = 10, tracks: int = 10, duration: float = 30, cover_size: int = 600) -> None:
+        self.books: int = books
+        self.tracks: int = tracks
+        self.duration: float = duration
+        self.cover_size: int = cover_size
+
+    @staticmethod
+    def png(size: int, color: tuple[int, int, int]) -> bytes:
+        """Square single color RGB PNG"""
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+        row: bytes = b"\x00" + bytes(color) * size
+        return (b"\x89PNG\r\n\x1a\n" +
+                chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)) +
+                chunk(b"IDAT", zlib.compress(row * size)) +
+                chunk(b"IEND", b""))
+
+    def mp3(self, path: str, tags: list, cover: bytes = b"") -> None:
+        """Write silent frames of duration seconds and their ID3 tag"""
+        frames: int = int(self.duration * self.sample_rate / self.samples_per_frame)
+        with open(path, "wb") as mp3_file:
+            mp3_file.write(self.frame * frames)
+        id3: ID3 = ID3()
+        for tag in tags:
+            id3.add(tag)
+        if cover:
+            id3.add(APIC(encoding=3, mime="image/png", type=3, desc="", data=cover))
+        id3.save(path)
+
+    def write(self, folder: str) -> list[str]:
+        """Write the library below folder, return the book folders"""
+        book_folders: list[str] = []
+        for book in range(self.books):
+            book_folder: str = f"{folder}/book_{book:04}"
+            os.makedirs(book_folder, exist_ok=True)
+            cover: bytes = self.png(self.cover_size, (book * 37 % 256, book * 91 % 256, 128))
+            for track in range(self.tracks):
+                self.mp3(f"{book_folder}/{track + 1:03}.mp3",
+                         [TALB(encoding=3, text=f"Book {book}"),
+                          TPE1(encoding=3, text=f"Author {book % 7}"),
+                          TIT2(encoding=3, text=f"Chapter {track + 1}"),
+                          TRCK(encoding=3, text=f"{track + 1}/{self.tracks}")],
+                         cover if track == 0 else b"")
+            book_folders.append(book_folder)
+        return book_folders
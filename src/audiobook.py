@@ -1,29 +1,39 @@
-import time, random, os
-from mutagen.easymp4 import EasyMP4
-from mutagen.mp3 import MP3
-from mutagen.mp4 import MP4, MP4Cover
-from multiprocessing.pool import ThreadPool
-from subprocess import Popen, PIPE, STDOUT
-from threading import Thread
-from PySide6.QtCore import (QUrl, QSize, QFileInfo, QDirIterator, QStandardPaths,
-                            QThreadPool, Signal, QObject)
-from PySide6.QtGui import QImage
-from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput
-from jsonio  import JsonIO
+import glob, hashlib, json, os, shutil, time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from threading import Thread, Lock
+from PySide6.QtCore import QUrl, QFileInfo, QStandardPaths, QThreadPool, QRunnable, Signal, QObject
+from library import Library
+from probe import Probe, CoverHandle
+from coverstore import CoverStore
+from filekey import file_key
+from scheduler import ExportScheduler, ExportJob
+from splitplanner import SplitPlanner
+from m4b import M4b, AudioTrack
+from encoders import Encoder, AbbinderEncoder
+from tagwriter import TagWriter
+from tracer import Tracer
 
 
 class Audiobook():
     """Edit data, audiobook files and meta data"""
+    # imports pick a free audiobook key before adding it
+    import_lock: Lock = Lock()
+    quality_presets: list[str] = ["96 KBps, Mono, 44100",
+                                  "96 KBps, Stereo, 48000",
+                                  "128 KBps, Stereo, 48000",
+                                  "256 KBps, Stereo, 48000",
+                                  "320 KBps, Stereo, 48000"]
+    split_duration: dict[str, int] = {"24h": 86400,
+                                      "20h": 72000,
+                                      "12h": 43200,
+                                      "10h": 36000}
+
     def __init__(self) -> None:
         super().__init__()
-        self.audiobook_json_path: str = os.path.dirname(os.path.realpath(__file__)) + "/audiobooks.json"
-        self.abbinder_path: str = os.path.dirname(os.path.realpath(__file__)) + "/abbinder"
+        self.store: Library = Library.instance()
+        self.encoder: Encoder = AbbinderEncoder()
         self.desktop_path: str = QStandardPaths.standardLocations(QStandardPaths.DesktopLocation)[0]
-        self.quality_presets: list[str] = ["96 KBps, Mono, 44100",
-                                           "96 KBps, Stereo, 48000",
-                                           "128 KBps, Stereo, 48000",
-                                           "256 KBps, Stereo, 48000",
-                                           "320 KBps, Stereo, 48000"]
         self.data: dict = {"audiobook_index": {"title": "",
                                                "author": "",
                                                "genre": "Audiobook",
@@ -34,17 +44,39 @@ class Audiobook():
                                                "quality": 2,
                                                "files": [],
                                                "export": True,}}
-        self.split_duration: dict[str, int] = {"24h": 86400,
-                                               "20h": 72000,
-                                               "12h": 43200,
-                                               "10h": 36000}
+        # longest part in seconds and largest projected part in bytes, 0 splits by duration only
+        self.max_duration: int = self.split_duration["24h"]
+        self.split_size: int = 0
+        # durations of Probe.modes, auto scans the frames of files with estimated durations
+        self.probe_mode: str = "auto"
+        # tag readers, mostly waiting for disk or network
+        self.import_workers: int = min(32, QThreadPool.globalInstance().maxThreadCount() * 4)
+        # encoder processes running at once
+        self.export_workers: int = QThreadPool.globalInstance().maxThreadCount()
+        # opt-in: long audiobooks are encoded in parallel segments of at least segment_duration
+        # and joined by M4b.concat, off every audiobook is a single encoder run
+        self.segment_export: bool = False
+        self.segment_duration: int = 1800
         self.data_export: dict = {}
+        # longest cover edge in exports, 0 keeps the cover size
+        self.tag_writer: TagWriter = TagWriter(cover_size=0)
+        self.scheduler: ExportScheduler = ExportScheduler(self.export_audiobook, self.export_workers)
         # export signal attributes
         self.signals: CostumSignals = CostumSignals()
         self._progress_range: int = 0
         self._progress_value: int = 0
         self._export_file: str = ""
         self._unlock_ui: bool = False
+        # encoded audio of the running export
+        self.export_started: float = 0
+        self.encoded_seconds: float = 0
+        self.encoded_files: int = 0
+        self.export_cancelled: bool = False
+        self.export_thread: Thread | None = None
+        # "file: error" of the files and folders the last import skipped
+        self.import_errors: list[str] = []
+        # jobs of the last export that were unchanged, retagged, encoded, failed or cancelled
+        self.export_jobs: list[ExportJob] = []
 
     @property
     def export_file(self) -> str:
@@ -83,168 +115,197 @@ class Audiobook():
         self.signals.unlock_ui.emit(lock)
 
     def save_data(self, data: dict) -> dict:
-        """Save user added data to json"""
-        JsonIO.write(data, self.audiobook_json_path)
+        """Replace the whole library"""
+        self.store.write_books(data)
         return data
 
-    def read_data(self) -> dict:
-        """Read data from json"""
-        return JsonIO.read(self.audiobook_json_path)
+    def read_data(self, files: bool = True) -> dict:
+        """Read the whole library
+        args: files = False only counts the files of each audiobook
+        """
+        return self.store.read_books(files=files)
+
+    def read_files(self, audiobook_key: str) -> list[dict]:
+        """Read the files of an audiobook"""
+        return self.store.read_tracks(audiobook_key)
+
+    def read_book(self, audiobook_key: str) -> dict:
+        """Read a single audiobook"""
+        return self.store.read_book(audiobook_key)
+
+    def update_data(self, audiobook_key: str, data: dict) -> dict:
+        """Update single fields of an audiobook, written when editing is idle"""
+        self.store.update_book(audiobook_key, data)
+        return data
 
     def delete_data(self, data: dict) -> dict:
-        """Delete data from json"""
-        json_data: dict = JsonIO.read(self.audiobook_json_path)
+        """Delete audiobooks, files or a cover
+        returns the changed audiobooks
+        """
         if "files" in data:
             # delete file
+            files: dict[str, list[str]] = {}
             for e_file in data["files"]:
-                if not e_file["audiobook_key"] in json_data:
-                    continue
-                for e_json_file in json_data[e_file["audiobook_key"]]["files"]:
-                    if not e_file["file"] in e_json_file["file"]:
-                        continue
-                    json_data[e_file["audiobook_key"]]["duration"] -= e_json_file["duration"]
-                    json_data[e_file["audiobook_key"]]["files"].remove(e_json_file)
+                files.setdefault(e_file["audiobook_key"], []).append(e_file["file"])
+            for e_key, e_files in files.items():
+                self.store.delete_tracks(e_key, e_files)
+            return self.store.read_books(list(files))
         elif "cover" in data:
-            json_data[data["audiobook_key"]].update({"cover": ""})
-        else:
-            # delete audiobook
-            for e_key in data["audiobook_keys"]:
-                json_data.pop(e_key, None)
-        self.save_data(json_data)
-        return json_data
-
-    def get_data(self, paths: list[QUrl]) -> dict:
-        """Collects files from list, creates a dict and saves it to json"""
-        files: list [str] = []
-        json_data: dict = self.read_data()
-        # collect and sort all files
+            self.store.update_book(data["audiobook_key"], {"cover": ""})
+            return self.store.read_books([data["audiobook_key"]])
+        # delete audiobook
+        self.store.delete_books(data["audiobook_keys"])
+        return {}
+
+    def walk_files(self, paths: list[QUrl]) -> Iterator[str]:
+        """Yield mp3s from files and folders while walking them
+        links to folders are not followed, unreadable folders are skipped and added to import_errors
+        """
         for each_path in paths:
             # folders
-            if QFileInfo(each_path.path()).isDir():
-                dir: QDirIterator = QDirIterator(each_path.path(), ["*.mp3"],
-                                                 flags=QDirIterator.Subdirectories)
-                while dir.hasNext():
-                    file: str = dir.next()
-                    files.append(file)
+            if os.path.isdir(each_path.path()):
+                folders: list[str] = [each_path.path()]
+                while folders:
+                    folder: str = folders.pop()
+                    # the span covers the listing, not the probes started from it
+                    try:
+                        with Tracer.instance().span("walk", folder=folder), os.scandir(folder) as scan:
+                            entries: list[os.DirEntry] = list(scan)
+                    except OSError as error:
+                        self.import_errors.append(f"{folder}: {error}")
+                        continue
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            folders.append(entry.path)
+                        elif entry.name.lower().endswith(".mp3"):
+                            yield entry.path
             else:
                 # files
                 if not each_path.path().lower().endswith(".mp3"):
                     continue
-                files.append(each_path.path())
-        files.sort()
+                yield each_path.path()
+
+    def probe_files(self, paths: list[QUrl], probe: Probe) -> dict[str, dict]:
+        """Probe files while the walk is still running
+        Only the cover of the first file in sort order is kept in memory.
+        Unreadable files are skipped and added to import_errors.
+        """
+        records: dict[str, dict] = {}
+        pending: set[Future] = set()
+        # future: probed file
+        probed: dict[Future, str] = {}
+        first_file: list[str] = []
+
+        def collect(done: set[Future]) -> None:
+            for each_future in done:
+                path: str = probed.pop(each_future)
+                try:
+                    record: dict = each_future.result()
+                except Exception as error:
+                    self.import_errors.append(f"{path}: {error}")
+                    continue
+                records.update({path: record})
+                if not first_file or path < first_file[0]:
+                    if first_file:
+                        records[first_file[0]]["cover_handle"].release()
+                    first_file[:] = [path]
+                else:
+                    record["cover_handle"].release()
+            self.signals.import_progress.emit(len(records), len(records) + len(pending))
+
+        with ThreadPoolExecutor(self.import_workers) as pool:
+            for each_file in self.walk_files(paths):
+                # bounded queue, the walk waits for slow tag readers
+                if len(pending) >= self.import_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                future: Future = pool.submit(probe.probe, each_file, True)
+                probed.update({future: each_file})
+                pending.add(future)
+            done, pending = wait(pending)
+            collect(done)
+        return records
+
+    def get_data(self, paths: list[QUrl]) -> dict:
+        """Collects files from list, creates a dict and adds it to the library"""
+        self.import_errors = []
+        with Tracer.instance().span("import", paths=[e.path() for e in paths]):
+            return self.import_files(paths)
+
+    def import_files(self, paths: list[QUrl]) -> dict:
+        """Probe the mp3s of paths and add them as a new audiobook"""
+        probe: Probe = Probe(mode=self.probe_mode)
+        with Tracer.instance().span("probe files"):
+            records: dict[str, dict] = self.probe_files(paths, probe)
+        files: list[str] = sorted(records)
         if not files:
             return {}
-        # add meta data to json
-        for each_file in files:
-            meta_data: dict = self.get_meta_data(each_file)
-            if "audiobook_index" in self.data:
-                index: str = f"audiobook_{len(json_data)}"
-                self.data.update({index: self.data.pop("audiobook_index")})
-                self.data[index].update({"title": meta_data["title"]})
-                self.data[index].update({"author": meta_data["author"]})
-                # cover
-                meta_cover = self.get_meta_cover(each_file, index)
-                if meta_cover:
-                    self.data[index].update({"cover": meta_cover})
-            self.data[index]["duration"] += meta_data["duration"]
-            self.data[index]["files"].append(dict(file=each_file,
-                                                  duration=meta_data["duration"]))
-        # try to apply existing author preset
-        preset: Preset = Preset().auto_apply_data(", ".join([meta_data["title"],
-                                                             meta_data["author"]]))
-        if preset:
-            author: list[str] = list(preset.keys())[0]
-            self.data[index].update({"author": author})
-            for key, value in preset[author].items():
-                self.data[index].update({key: value})
-        json_data.update(self.data)
-        self.save_data(json_data)
+        with self.import_lock:
+            # add meta data in sorted order
+            for each_file in files:
+                meta_data: dict = records[each_file]
+                if "audiobook_index" in self.data:
+                    index: str = self.store.next_key()
+                    self.data.update({index: self.data.pop("audiobook_index")})
+                    self.data[index].update({"title": meta_data["title"]})
+                    self.data[index].update({"author": meta_data["author"]})
+                    # cover
+                    meta_cover: str = self.extract_cover(meta_data["cover_handle"], index)
+                    if meta_cover:
+                        self.data[index].update({"cover": meta_cover})
+                self.data[index]["duration"] += meta_data["duration"]
+                self.data[index]["files"].append(dict(file=each_file,
+                                                      duration=meta_data["duration"],
+                                                      bitrate=meta_data["bitrate"],
+                                                      channels=meta_data["channels"],
+                                                      sample_rate=meta_data["sample_rate"],
+                                                      vbr=meta_data["vbr"]))
+            # try to apply existing author preset
+            preset: Preset = Preset().auto_apply_data(", ".join([meta_data["title"],
+                                                                 meta_data["author"]]))
+            if preset:
+                author: list[str] = list(preset.keys())[0]
+                self.data[index].update({"author": author})
+                for key, value in preset[author].items():
+                    self.data[index].update({key: value})
+            with Tracer.instance().span("write library", key=index):
+                self.store.add_books(self.data)
+        probe.cache.save()
         return self.data
 
-    def get_meta_data(self, path: str) -> dict:
-        """Read ID3 tags from mp3
-        title, author, duration
-        """
-        audio_file: MP3 = MP3(path)
-        meta_data: dict = {}
-        for key, e_tag in [["title", "TALB"], ["author", "TPE1"]]:
-            if not e_tag in audio_file:
-                meta_data.update({key: ""})
-                continue
-            meta_data.update({key: " ".join(audio_file[e_tag].text)})
-        meta_data.update({"duration": round(audio_file.info.length)})
-        return meta_data
-
-    def get_meta_cover(self, path: str, audiobook_key: str) -> str:
-        """Extract and save ID3 cover from mp3"""
-        audio_file: MP3 = MP3(path)
-        cover_key: list[str] = [key for key in audio_file if "APIC:" in key.upper()]
-        if not cover_key:
-            return ""
-        tag_cover: bytes = audio_file[cover_key[0]].data
-        cover: QImage = QImage()
-        cover.loadFromData(tag_cover)
-        export_path: str = QFileInfo(path).path() + f"/{audiobook_key}_COVER.png"
-        cover.save(export_path)
-        return export_path
+    def extract_cover(self, cover_handle: CoverHandle, audiobook_key: str) -> str:
+        """Save ID3 cover from mp3 to the cover store"""
+        with Tracer.instance().span("store cover", key=audiobook_key, file=cover_handle.path):
+            return CoverStore.instance().add_handle(cover_handle)
 
     def resize_cover(self, audiobook_key: str) -> str:
-        """Squares cover"""
-        data: dict = self.read_data()
-        path: str = data[audiobook_key]["cover"]
-        cover: QImage = QImage()
-        cover.load(path)
-        if cover.width() > cover.height():
-            size: QSize = QSize(cover.width(), cover.width())
-        else:
-            size: QSize = QSize(cover.height(), cover.height())
-        cover = cover.scaled(size)
-        cover.save(path)
-        return path
+        """Squares cover, the squared cover is a new file in the cover store"""
+        return CoverStore.instance().square(self.read_book(audiobook_key)["cover"])
 
     def set_meta_data(self, path: str,  data: dict) -> None:
-        """Save meta tags to m4b"""
-        audio_file: EasyMP4 = EasyMP4(path)
-        # set metadata
-        audio_file["title"] = data["title"]
-        audio_file["album"] = data["title"].split(" Part")[0]
-        audio_file["artist"] = data["author"]
-        audio_file["genre"] = data["genre"]
-        audio_file["tracknumber"] = f"{data['tracknumber'][0]}/{data['tracknumber'][1]}"
-        audio_file.save()
-        # set cover image
-        audio_file: MP4 = MP4(path)
-        with open(data["cover"], "rb") as cover_file:
-            audio_file.tags["covr"] = [MP4Cover(cover_file.read(), MP4Cover.FORMAT_PNG)]
-            audio_file.save()
-
-    def split_audiobooks(self) -> None:
-        """Split audiobooks into XXh parts"""
-        json_data: dict = self.read_data()
+        """Save meta tags and cover to m4b"""
+        with Tracer.instance().span("set_meta_data", title=data["title"], file=path):
+            self.tag_writer.write(path, data)
+
+    def split_audiobooks(self, keys: list[str] | None = None) -> None:
+        """Split audiobooks over max_duration into the fewest, nearly equal parts
+        args: keys = audiobooks to export, all audiobooks without keys
+        """
+        json_data: dict = self.store.read_books(keys)
         for e_key, e_data in json_data.items():
             if not e_data["export"]:
                 continue
             audiobook: dict = {}
-            files: list[list] = [[]]
-            files_index: int = 0
             key_index: int = len(self.data_export)
-            duration: int = 0
             # change audiobook_1 key if exists
             audiobook_key: str = f"{e_key[:-1]}{key_index}" if e_key in self.data_export else e_key
+            bitrate: int = int(self.export_settings(e_data)[0].split()[0])
+            planner: SplitPlanner = SplitPlanner(self.max_duration, self.split_size)
+            files: list[list[dict]] = planner.plan(e_data["files"], bitrate)
             # audiobook LESS then XXh
-            if e_data["duration"] <= self.split_duration["24h"]:
+            if len(files) == 1:
                 self.data_export.update({audiobook_key: e_data})
                 continue
-            # audiobook MORE then XXh
-            # split files in parts
-            for e_file in e_data["files"]:
-                if sum([duration, e_file["duration"]]) <= self.split_duration["24h"]:
-                    duration += e_file["duration"]
-                    files[files_index].append(e_file)
-                    continue
-                duration = e_file["duration"]
-                files_index += 1
-                files.append([e_file])
             # create a new dict from file parts
             for part, e_file in enumerate(files, 1):
                 audiobook_key = f"{e_key[:-1]}{key_index}"
@@ -260,87 +321,332 @@ class Audiobook():
                 key_index += 1
             self.data_export.update(audiobook)
 
-    def export(self) -> None:
-        """Export audiobook"""
+    def export(self, resume: bool = False, keys: list[str] | None = None) -> None:
+        """Export audiobook
+        args: resume = continue the unfinished jobs of the export journal
+              keys = audiobooks to export, all audiobooks marked for export without keys
+        """
+        self.store.flush()
         self.data_export.clear()
-        self.split_audiobooks()
+        self.export_cancelled = False
+        self.scheduler.reset()
+        if resume:
+            self.data_export.update(self.store.read_export_jobs())
+        else:
+            self.split_audiobooks(keys)
+            self.keep_unfinished_jobs()
+            self.store.write_export_jobs(self.data_export)
         if not self.data_export:
             self.unlock_ui = True
             self.export_file = "Nothing to export…\n"
             return
         self.unlock_ui = False
-        self.progress_range = len(self.data_export)
-        self.export_file = f"Start exporting {self.progress_range} file(s)…\n"
+        # progress in seconds of encoded audio
+        self.progress_range = round(sum(e["duration"] for e in self.data_export.values()))
+        self.progress_value = 0
+        self.export_file = f"Start exporting {len(self.data_export)} file(s)…\n"
         # Extra thread to avoid ui freeze
-        export_thread: Thread = Thread(target=self.export_pool)
-        export_thread.start()
+        self.export_thread = Thread(target=self.export_pool)
+        self.export_thread.start()
+
+    def keep_unfinished_jobs(self) -> None:
+        """Add the unfinished jobs of the export journal to a new export, first in export order
+        Jobs writing a file of the new export are replaced by it.
+        """
+        export_files: set[str] = {self.export_path(e) for e in self.data_export.values()}
+        data_export: dict = dict(self.data_export)
+        self.data_export.clear()
+        for e_key, e_data in self.store.read_export_jobs().items():
+            if self.export_path(e_data) in export_files:
+                continue
+            # export keys restart at 0 with every export
+            self.data_export.update({f"{e_key}_resumed" if e_key in data_export else e_key: e_data})
+        self.data_export.update(data_export)
 
     def export_pool(self) -> None:
-        """Multiprocessing depending on cpu cores"""
-        with ThreadPool(QThreadPool().maxThreadCount()) as export_pool:
-            export_pool.map(self.export_audiobook, self.data_export.values())
+        """Run the exports longest first, export_workers at once"""
+        with Tracer.instance().span("export", books=len(self.data_export)):
+            self.run_exports()
+        Tracer.instance().save()
+        self.progress_value = self.progress_range
         self.export_file = "Done exporting…\n"
         self.unlock_ui = True
 
-    def export_audiobook(self, data: dict) -> None:
-        """Main export function"""
-        time.sleep(random.uniform(0.01, 5.0))
-        self.export_file = f"%  STARTED --> {data['title']}\n"
-        export_file: str = f"{data['destination']}/{data['title']}.m4b"
+    def run_exports(self) -> None:
+        """Skip unchanged exports, retag the ones with unchanged audio and encode the rest"""
+        self.scheduler.concurrency = max(1, self.export_workers)
+        self.export_started = time.monotonic()
+        self.encoded_seconds = 0
+        self.encoded_files = 0
+        self.tag_writer.clear()
+        self.export_jobs = []
+        jobs: list[ExportJob] = []
+        # unchanged and retagged jobs
+        skipped: list[ExportJob] = []
+        # exports of this run are never moved away for a retag, unchanged ones included
+        export_files: set[str] = {self.export_path(e) for e in self.data_export.values()}
+        for e_key, e_data in self.data_export.items():
+            job: ExportJob = ExportJob(e_key, e_data)
+            job.audio_fingerprint, job.fingerprint = self.export_fingerprint(e_data)
+            if self.export_unchanged(job):
+                self.export_file = f"%  UNCHANGED --> {e_data['title']}\n"
+                self.store.update_export_job(e_key, "done")
+                job.state = "unchanged"
+                skipped.append(job)
+                continue
+            jobs.append(job)
+        for job in list(jobs):
+            if self.export_cancelled:
+                break
+            try:
+                with Tracer.instance().span("retag", key=job.key):
+                    retagged: bool = self.export_retagged(job, export_files)
+            except Exception as error:
+                self.export_file = f"%  RETAG FAILED --> {job.data['title']}: {error}\n"
+                continue
+            if retagged:
+                self.export_file = f"%  RETAGGED --> {job.data['title']}\n"
+                self.store.update_export_job(job.key, "done")
+                job.state = "retagged"
+                skipped.append(job)
+                jobs.remove(job)
+        self.progress_range = round(sum(e.data["duration"] for e in jobs))
+        if self.export_cancelled:
+            for job in jobs:
+                job.state = "cancelled"
+        else:
+            jobs = self.scheduler.run(jobs)
+        self.export_jobs = skipped + jobs
+        for job in jobs:
+            if job.state == "failed":
+                self.export_file = f"%  FAILED --> {job.data['title']}: {job.error}\n"
+                self.store.update_export_job(job.key, "failed")
+            elif job.state == "cancelled":
+                # cancelled jobs are resumed like the ones of a crashed export
+                self.export_file = f"%  CANCELLED --> {job.data['title']}\n"
+                self.store.update_export_job(job.key, "pending")
+        if not self.store.read_export_jobs():
+            self.store.clear_export_jobs()
+
+    def cancel_export(self) -> None:
+        """Stop a running export, its unfinished jobs stay in the journal for a resume"""
+        self.export_cancelled = True
+        self.scheduler.cancel()
+        self.export_file = "Cancelling export…\n"
+
+    def discard_export(self) -> None:
+        """Forget the unfinished jobs of the export journal and remove their partial files"""
+        for e_data in self.store.read_export_jobs().values():
+            export_file: str = self.export_path(e_data)
+            partial_files: list[str] = glob.glob(f"{glob.escape(export_file[:-4])}.part[0-9]*.m4b")
+            for path in [self.export_temp_path(export_file), *partial_files]:
+                if os.path.exists(path):
+                    os.remove(path)
+        self.store.clear_export_jobs()
+
+    def export_path(self, data: dict) -> str:
+        """M4b file of an audiobook, on the desktop if its destination is missing"""
         if not QFileInfo(data['destination']).exists():
-            export_file = f"{self.desktop_path}/{data['title']}.m4b"
-        files: str = [e["file"] for e in data['files']]
+            return f"{self.desktop_path}/{data['title']}.m4b"
+        return f"{data['destination']}/{data['title']}.m4b"
+
+    @staticmethod
+    def export_temp_path(export_file: str) -> str:
+        """Unfinished m4b, renamed to export_file once it is encoded and tagged"""
+        return f"{export_file[:-4]}.encoding.m4b"
+
+    def export_fingerprint(self, data: dict) -> tuple[str, str]:
+        """Hashes of the encoded audio and of the whole export, empty if a file is missing
+        the audio hash covers source files and settings, the export hash adds tags, cover and path
+        """
+        try:
+            files: list[list] = [[e["file"], *file_key(e["file"])] for e in data["files"]]
+            cover: list = [data["cover"], *file_key(data["cover"])] if data["cover"] else []
+        except OSError:
+            return "", ""
+        audio: dict = dict(encoder=self.encoder.name,
+                           settings=self.export_settings(data),
+                           files=files)
+        audio_fingerprint: str = hashlib.sha1(json.dumps(audio).encode()).hexdigest()
+        fingerprint: dict = dict(audio=audio_fingerprint,
+                                 cover=cover,
+                                 path=self.export_path(data),
+                                 tags=[data[e] for e in ["title", "author", "genre", "tracknumber"]])
+        return audio_fingerprint, hashlib.sha1(json.dumps(fingerprint).encode()).hexdigest()
+
+    def export_unchanged(self, job: ExportJob) -> bool:
+        """True if the m4b of job exists from an export with the same fingerprint"""
+        if not job.fingerprint:
+            return False
+        export_file: str = self.export_path(job.data)
+        exported: dict | None = self.store.read_export(export_file)
+        if exported is None or exported["fingerprint"] != job.fingerprint:
+            return False
+        try:
+            return file_key(export_file) == [exported["size"], exported["mtime_ns"]]
+        except OSError:
+            return False
+
+    def export_retagged(self, job: ExportJob, export_files: set[str]) -> bool:
+        """Rewrite tags and cover of an earlier export with the same audio instead of encoding
+        A copy of the earlier export is tagged and renamed to the export file, the earlier
+        export is removed if title or destination changed. A crash leaves it untouched.
+        args: export_files = m4b files of all jobs of the run, only the one of job may be retagged
+        """
+        if not job.audio_fingerprint:
+            return False
+        export_file: str = self.export_path(job.data)
+        for exported in self.store.read_exports(job.audio_fingerprint):
+            if exported["file"] != export_file and exported["file"] in export_files:
+                continue
+            try:
+                if file_key(exported["file"]) != [exported["size"], exported["mtime_ns"]]:
+                    continue
+            except OSError:
+                continue
+            temp_file: str = self.export_temp_path(export_file)
+            shutil.copyfile(exported["file"], temp_file)
+            self.set_meta_data(temp_file, job.data)
+            os.replace(temp_file, export_file)
+            self.store.write_export(export_file, job.fingerprint, job.audio_fingerprint)
+            if exported["file"] != export_file:
+                os.remove(exported["file"])
+                self.store.delete_export(exported["file"])
+            return True
+        return False
+
+    def export_settings(self, data: dict) -> list[str]:
+        """Bitrate, channels and sample rate from quality preset and probed sources"""
         bitrate, channels, sample_rate = self.quality_presets[data['quality']].split(", ")
         channels: str = "2" if "Stereo" in channels else "1" # Stereo, Mono
-        abbinder_cmd: str = [self.abbinder_path, # executable path
-                             "-sv",              # skip errors, print infos
-                             "-b", bitrate,      # in KBps
-                             "-r", sample_rate,  # (44100 default), 48000
-                             "-c", channels,     # 1, (2 default)
-                             "-E", "%N",         # chapter by file: %N -> numbered
-                             export_file,        # export path
-                             *files]             # source files
-        process: Popen = Popen(abbinder_cmd, stdout=PIPE, stderr=STDOUT)
-        _stdout, _stderr = process.communicate()
-        self.set_meta_data(export_file, data)
+        # don't upmix mono sources, older library data has no stream infos
+        source_channels: list[int] = [e.get("channels", 2) for e in data["files"]]
+        if source_channels and max(source_channels) == 1:
+            channels = "1"
+        return [bitrate, channels, sample_rate]
+
+    def export_segments(self, data: dict) -> list[list[dict]]:
+        """Files of each segment that is encoded on its own"""
+        segments: int = min(self.export_workers, len(data["files"]),
+                            int(data["duration"] // self.segment_duration))
+        if not self.segment_export or segments < 2:
+            return [data["files"]]
+        return SplitPlanner(data["duration"]).balance(data["files"], segments)
+
+    def files_encoded(self, job: ExportJob, files: list[dict]) -> None:
+        """Count encoded files and report progress and throughput"""
+        if not files:
+            return
+        self.encoded_seconds += sum(e["duration"] for e in files)
+        self.encoded_files += len(files)
+        job.encoded_files += len(files)
+        self.signals.file_progress.emit(job.data["title"], job.encoded_files, len(job.data["files"]))
+        elapsed: float = max(time.monotonic() - self.export_started, 0.001)
+        self.signals.throughput.emit(self.encoded_seconds / elapsed, self.encoded_files / elapsed * 60)
+        self.progress_value = round(self.encoded_seconds)
+
+    async def encode(self, job: ExportJob, export_file: str, files: list[dict], settings: list[str]) -> None:
+        """Encode files to export_file, files count as encoded when the encoder starts the next one"""
+        encoded: int = 0
+
+        def output(line: str) -> None:
+            nonlocal encoded
+            index: int | None = self.encoder.progress(line, files)
+            if index is not None and index > encoded:
+                self.files_encoded(job, files[encoded:index])
+                encoded = index
+
+        # segments of a job encode at once, every encoder gets its own timeline
+        with Tracer.instance().span("encode", track=f"{job.key} {os.path.basename(export_file)}",
+                                    key=job.key, file=export_file, files=len(files)):
+            await self.scheduler.process(job, *self.encoder.command(export_file, files, settings), output=output)
+        self.files_encoded(job, files[encoded:])
+
+    def concat_segments(self, paths: list[str], export_file: str, segments: list[list[dict]]) -> None:
+        """Join encoded segments and rebuild the chapters of their files"""
+        chapters: list[tuple[float, str]] = []
+        start: float = 0
+        for path, files in zip(paths, segments):
+            # scale file durations to the encoded segment length
+            seconds: float = AudioTrack(path).seconds
+            scale: float = seconds / (sum(e["duration"] for e in files) or 1)
+            for e_file in files:
+                chapters.append((start, str(len(chapters) + 1)))
+                start += e_file["duration"] * scale
+        M4b.concat(paths, export_file, chapters)
+
+    async def export_audiobook(self, job: ExportJob) -> None:
+        """Main export function"""
+        # jobs overlap on the loop thread, every job gets its own timeline
+        with Tracer.instance().span("export audiobook", track=job.key, key=job.key, title=job.data["title"]):
+            await self.export_job(job)
+
+    async def export_job(self, job: ExportJob) -> None:
+        tracer: Tracer = Tracer.instance()
+        data: dict = job.data
+        import asyncio
+        self.export_file = f"%  STARTED --> {data['title']}\n"
+        self.store.update_export_job(job.key, "running")
+        export_file: str = self.export_path(data)
+        # a killed export never leaves a half written export_file
+        temp_file: str = self.export_temp_path(export_file)
+        segments: list[list[dict]] = self.export_segments(data)
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        settings: list[str] = self.export_settings(data)
+        paths: list[str] = [f"{export_file[:-4]}.part{index}.m4b" for index in range(len(segments))]
+        try:
+            if len(segments) == 1:
+                await self.encode(job, temp_file, data["files"], settings)
+                with tracer.span("validate", track=job.key, file=temp_file):
+                    await loop.run_in_executor(None, self.encoder.validate, temp_file)
+            else:
+                await asyncio.gather(*[self.encode(job, e_path, e_files, settings)
+                                       for e_path, e_files in zip(paths, segments)])
+                with tracer.span("concat", track=job.key, file=temp_file, segments=len(paths)):
+                    await loop.run_in_executor(None, self.concat_segments, paths, temp_file, segments)
+            # tagging blocks, keep the loop free for the other encoders
+            await loop.run_in_executor(None, self.set_meta_data, temp_file, data)
+            os.replace(temp_file, export_file)
+        finally:
+            for path in [temp_file, *paths]:
+                if os.path.exists(path):
+                    os.remove(path)
+        if job.fingerprint:
+            self.store.write_export(export_file, job.fingerprint, job.audio_fingerprint)
+        self.store.update_export_job(job.key, "done")
         self.export_file = f"%  DONE --> {data['title']}\n"
-        self.progress_value += 1
 
 
 class Preset():
     """Edit preset data"""
     def __init__(self) -> None:
-        self.preset_json_path: str = os.path.dirname(os.path.realpath(__file__)) + "/presets.json"
+        self.store: Library = Library.instance()
         self.desktop_path: str = QStandardPaths.standardLocations(QStandardPaths.DesktopLocation)[0]
         self.data: dict = {"author": {"destination": self.desktop_path,
                                       "quality": 1}}
 
     def save_data(self, data: dict) -> dict:
-        """Save user added data to json"""
-        JsonIO.write(data, self.preset_json_path)
+        """Add or replace presets"""
+        self.store.write_presets(data)
         return data
 
     def read_data(self) -> dict:
-        """Read data from json"""
-        return JsonIO.read(self.preset_json_path)
+        """Read all presets"""
+        return self.store.read_presets()
 
     def delete_data(self, key: str) -> dict:
-        """Delete data from json
+        """Delete preset
         args: key = name of preset
         """
-        json_data: dict = self.read_data()
-        json_data.pop(key, None)
-        self.save_data(json_data)
-        return json_data
+        self.store.delete_preset(key)
+        return self.read_data()
 
     def get_data(self, user_inputs: dict) -> dict:
         """Collect data from user inputs"""
-        json_data: dict = self.read_data()
         self.data.update({user_inputs["author"]: self.data.pop("author")})
         for key, value in self.data[user_inputs["author"]].items():
             self.data[user_inputs["author"]].update({key: user_inputs[key]})
-        json_data.update(self.data)
-        self.save_data(json_data)
+        self.save_data(self.data)
         return self.data
 
     def auto_apply_data(self, meta_data: str) -> dict:
@@ -357,43 +663,58 @@ class Preset():
         return self.data
 
 
-class AudioPlayer(QMediaPlayer):
-    """Audioplayer plays audiofiles"""
-    def __init__(self, parent) -> None:
+class AudiobookImport(QRunnable):
+    """Run Audiobook.get_data in a thread pool
+    args: paths = dropped or selected files and folders
+    """
+    def __init__(self, args: dict) -> None:
         super().__init__()
-        self.setParent(parent)
-        self.audio_output: QAudioOutput = QAudioOutput(parent)
-        self.setAudioOutput(self.audio_output)
-        self.playing_state: bool = False
-
-    def play_audio(self, path: str) -> None:
-        """Start, stop and switch files"""
-        if not self.validate_file(path):
-            return
-        if self.playbackState() == QMediaPlayer.StoppedState:
-            self.setSource(QUrl.fromLocalFile(path))
-            self.play()
-            self.playing_state = True
-        elif path not in self.source().path():
-            # switch file without stopping
-            self.setSource(QUrl.fromLocalFile(path))
-            self.play()
-            self.playing_state = True
-        else:
-            self.stop()
-            self.playing_state = False
+        self.audiobook: Audiobook = Audiobook()
+        self.signals: CostumSignals = self.audiobook.signals
+        self.args: dict = args
+
+    def run(self) -> None:
+        """imported is always emitted, empty if the import failed"""
+        data: dict = {}
+        try:
+            data = self.audiobook.get_data(self.args["paths"])
+        except Exception as error:
+            self.audiobook.import_errors.append(str(error))
+        if self.audiobook.import_errors:
+            self.signals.import_errors.emit(self.audiobook.import_errors)
+        self.signals.imported.emit(data)
+
+
+class CoverResize(QRunnable):
+    """Run Audiobook.resize_cover in a thread pool
+    args: audiobook_key = audiobook key from library
+    """
+    def __init__(self, args: dict) -> None:
+        super().__init__()
+        self.audiobook: Audiobook = Audiobook()
+        self.signals: CostumSignals = self.audiobook.signals
+        self.args: dict = args
 
-    def validate_file(self, path: str) -> bool:
-        """Check for valid files (mp3, exists)"""
-        if (not path.endswith(".mp3") or
-           not QFileInfo(path).exists()):
-            return False
-        return True
+    def run(self) -> None:
+        self.signals.cover_resized.emit(self.audiobook.resize_cover(self.args["audiobook_key"]))
 
 
 class CostumSignals(QObject):
     """Costum signals for widgets to connect to"""
+    imported = Signal(dict)
+    import_progress = Signal(int, int)
+    # "file: error" of skipped files, emitted before imported
+    import_errors = Signal(list)
+    cover_resized = Signal(str)
+    # QImage, audiobook stays free of QtGui for headless exports
+    thumbnail = Signal(str, object)
+    thumbnail_ready = Signal(str)
     export_file = Signal(str)
     progress_range = Signal(int)
     progress_value = Signal(int)
-    unlock_ui = Signal(bool)
\ No newline at end of file
+    file_progress = Signal(str, int, int)
+    throughput = Signal(float, float)
+    unlock_ui = Signal(bool)
+    # watch folder, audiobook key is empty for folders without mp3s
+    folder_imported = Signal(str, str)
+    folders_exported = Signal(list)
\ No newline at end of file
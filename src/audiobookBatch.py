@@ -0,0 +1,225 @@
+import argparse, json, os, signal, sys, time
+from threading import Lock
+from PySide6.QtCore import QCoreApplication, QUrl, Qt
+from audiobook import Audiobook, Preset
+from encoders import Encoder, AbbinderEncoder
+from library import Library
+from probe import Probe
+from tracer import Tracer
+from watchfolder import WatchFolder
+
+
+class AudiobookBatch():
+    """Headless import and export without widgets
+    Every folder becomes an audiobook like a folder dropped on the library, with --watch
+    the folders are inboxes and every folder dropped into them is converted. Progress
+    is printed to stdout as one JSON object per line, e.g.
+    {"event": "progress", "time": 1.2, "value": 120, "range": 3600}
+    args: args = parsed command line of parser()
+    """
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args: argparse.Namespace = args
+        self.started: float = time.monotonic()
+        self.print_lock: Lock = Lock()
+
+    @staticmethod
+    def parser() -> argparse.ArgumentParser:
+        quality_presets: list[str] = Audiobook.quality_presets
+        parser: argparse.ArgumentParser = argparse.ArgumentParser(
+            description="Convert audiobook folders of mp3 files to m4b without the GUI")
+        parser.add_argument("folders", nargs="*", help="folders and mp3 files, one audiobook each")
+        parser.add_argument("--destination", help="export folder, default from preset or desktop")
+        parser.add_argument("--quality", type=int, choices=range(len(quality_presets)),
+                            help=", ".join(f"{index}: {e}" for index, e in enumerate(quality_presets)))
+        parser.add_argument("--preset", help="author preset applied to every audiobook")
+        parser.add_argument("--split", choices=list(Audiobook.split_duration), default="24h",
+                            help="longest part of split audiobooks")
+        parser.add_argument("--split-size", type=int, default=0, help="largest part in MB, 0 for no limit")
+        parser.add_argument("--workers", type=int, default=0, help="encoder processes, default one per core")
+        parser.add_argument("--segments", action="store_true",
+                            help="encode long audiobooks in parallel segments and join them, default one encoder run each")
+        parser.add_argument("--encoder", default="abbinder", help="abbinder or stub")
+        parser.add_argument("--encoder-path", default="", help="abbinder executable")
+        parser.add_argument("--resume", action="store_true", help="continue the unfinished jobs of the last export")
+        parser.add_argument("--probe", choices=Probe.modes, default="auto",
+                            help="mp3 durations: auto counts the frames of files with estimated durations, "
+                                 "fast reads headers only, exact counts the frames of every file")
+        parser.add_argument("--keep", action="store_true", help="keep imported audiobooks in the library")
+        parser.add_argument("--library", default="", help="sqlite library, default the one of the GUI")
+        parser.add_argument("--watch", action="store_true", help="convert the folders dropped into the given inboxes")
+        parser.add_argument("--quiet-period", type=float, default=30,
+                            help="seconds without changes before a dropped folder is imported")
+        parser.add_argument("--max-queued", type=int, default=4,
+                            help="imported audiobooks waiting for their export, later folders wait in the inbox")
+        parser.add_argument("--trace", default="",
+                            help="write a Chrome trace of import and export, opens in ui.perfetto.dev")
+        return parser
+
+    def emit(self, event: str, **fields) -> None:
+        """Print a progress line"""
+        line: str = json.dumps(dict(event=event, time=round(time.monotonic() - self.started, 3), **fields))
+        with self.print_lock:
+            print(line, flush=True)
+
+    def book_fields(self) -> dict:
+        """Audiobook fields of the --preset, --destination and --quality options"""
+        fields: dict = {}
+        if self.args.preset:
+            fields.update({"author": self.args.preset, **Preset().read_data()[self.args.preset]})
+        if self.args.destination:
+            # missing destinations would fall back to the desktop
+            os.makedirs(self.args.destination, exist_ok=True)
+            fields.update({"destination": os.path.abspath(self.args.destination)})
+        if self.args.quality is not None:
+            fields.update({"quality": self.args.quality})
+        return fields
+
+    def import_folders(self) -> list[str]:
+        """Import each folder as an audiobook and apply presets and options"""
+        keys: list[str] = []
+        fields: dict = self.book_fields()
+        for folder in self.args.folders:
+            audiobook: Audiobook = Audiobook()
+            audiobook.probe_mode = self.args.probe
+            audiobook.signals.import_progress.connect(lambda done, total, folder=folder:
+                                                      self.emit("import", folder=folder, done=done, total=total),
+                                                      Qt.DirectConnection)
+            try:
+                data: dict = audiobook.get_data([QUrl.fromLocalFile(os.path.abspath(folder))])
+            except Exception as error:
+                audiobook.import_errors.append(f"{folder}: {error}")
+                data = {}
+            for error in audiobook.import_errors:
+                self.emit("skipped", message=error)
+            if not data:
+                self.emit("log", message=f"No readable mp3 files in {folder}")
+                continue
+            key: str = list(data)[0]
+            if fields:
+                audiobook.update_data(key, fields)
+            keys.append(key)
+            self.emit("imported", key=key, title=data[key]["title"], author=fields.get("author", data[key]["author"]),
+                      files=len(data[key]["files"]), duration=data[key]["duration"])
+        return keys
+
+    def configure(self, audiobook: Audiobook) -> None:
+        """Set the export options and print the export progress of audiobook"""
+        audiobook.encoder = Encoder.create(self.args.encoder,
+                                           **({"path": self.args.encoder_path} if self.args.encoder_path else {}))
+        if self.args.workers:
+            audiobook.export_workers = self.args.workers
+        audiobook.segment_export = self.args.segments
+        audiobook.max_duration = audiobook.split_duration[self.args.split]
+        audiobook.split_size = self.args.split_size * 1000 * 1000
+        # signals come from the export threads, there is no event loop
+        signals = audiobook.signals
+        signals.export_file.connect(lambda message: self.emit("log", message=message.strip()), Qt.DirectConnection)
+        signals.progress_value.connect(lambda value: self.emit("progress", value=value,
+                                                               range=audiobook.progress_range),
+                                       Qt.DirectConnection)
+        signals.file_progress.connect(lambda title, done, total:
+                                      self.emit("file", title=title, done=done, total=total),
+                                      Qt.DirectConnection)
+        signals.throughput.connect(lambda seconds, files:
+                                   self.emit("throughput", realtime=round(seconds, 2),
+                                             files_per_minute=round(files, 2)),
+                                   Qt.DirectConnection)
+
+    def export(self, keys: list[str] | None) -> list:
+        """Export audiobooks of keys or resume the last export, blocks until it is done"""
+        audiobook: Audiobook = Audiobook()
+        self.configure(audiobook)
+        signal.signal(signal.SIGINT, lambda *args: audiobook.cancel_export())
+        signal.signal(signal.SIGTERM, lambda *args: audiobook.cancel_export())
+        audiobook.export(resume=keys is None, keys=keys)
+        # join in steps, signal handlers only run between them
+        while audiobook.export_thread is not None and audiobook.export_thread.is_alive():
+            audiobook.export_thread.join(0.2)
+        return audiobook.export_jobs
+
+    def watch(self) -> int:
+        """Convert folders dropped into the inboxes until SIGINT or SIGTERM"""
+        watch_folder: WatchFolder = WatchFolder(self.args.folders, self.args.quiet_period, self.args.max_queued,
+                                                configure=self.configure, keep=self.args.keep)
+        watch_folder.probe_mode = self.args.probe
+        fields: dict = self.book_fields()
+
+        def imported(folder: str, key: str) -> None:
+            if not key:
+                self.emit("log", message=f"No readable mp3 files in {folder}")
+                return
+            # the export of key starts with the next tick at the earliest
+            if fields:
+                Audiobook().update_data(key, fields)
+            self.emit("imported", folder=folder, key=key)
+
+        def skipped(errors: list[str]) -> None:
+            for error in errors:
+                self.emit("skipped", message=error)
+
+        watch_folder.signals.folder_imported.connect(imported)
+        watch_folder.signals.import_errors.connect(skipped)
+        watch_folder.signals.folders_exported.connect(lambda keys: self.emit("exported", keys=keys))
+
+        def stop(*args) -> None:
+            # a running export is cancelled and stays in the journal
+            watch_folder.stop()
+            QCoreApplication.quit()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        watch_folder.start()
+        self.emit("watching", inboxes=watch_folder.inboxes)
+        QCoreApplication.exec()
+        Library.instance().flush()
+        return 0
+
+    def run(self) -> int:
+        """Exit code 0 if all exports are done, 1 if one failed, 130 if cancelled"""
+        if self.args.watch:
+            return self.watch()
+        keys: list[str] | None = None
+        if not self.args.resume:
+            keys = self.import_folders()
+            if not keys:
+                self.emit("finished", done=0, unchanged=0, retagged=0, failed=0, cancelled=0)
+                return 1
+        jobs: list = self.export(keys)
+        if keys and not self.args.keep:
+            Library.instance().delete_books(keys)
+        Library.instance().flush()
+        states: list[str] = [e.state for e in jobs]
+        self.emit("finished", done=states.count("done"), unchanged=states.count("unchanged"),
+                  retagged=states.count("retagged"), failed=states.count("failed"),
+                  cancelled=states.count("cancelled"))
+        if "failed" in states:
+            return 1
+        return 130 if "cancelled" in states else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser: argparse.ArgumentParser = AudiobookBatch.parser()
+    args: argparse.Namespace = parser.parse_args(argv)
+    # kept by Qt until main returns, runs the event loop of --watch
+    QCoreApplication(sys.argv[:1])
+    if args.library:
+        Library.instance(os.path.abspath(args.library))
+    if not args.folders and not args.resume:
+        parser.error("give folders to convert or --resume")
+    if args.preset and args.preset not in Preset().read_data():
+        parser.error(f"unknown preset \"{args.preset}\"")
+    try:
+        Encoder.create(args.encoder)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.encoder_path and args.encoder != AbbinderEncoder.name:
+        parser.error(f"--encoder-path is only used by {AbbinderEncoder.name}")
+    if args.trace:
+        Tracer.instance().start(args.trace)
+    try:
+        return AudiobookBatch(args).run()
+    finally:
+        Tracer.instance().save()
+
+if __name__ == "__main__":
+    sys.exit(main())
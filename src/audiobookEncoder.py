@@ -1,7 +1,11 @@
-from PySide6.QtWidgets import QApplication, QMainWindow, QMenuBar, QWidget
+from PySide6.QtWidgets import QApplication, QMainWindow, QMenuBar, QWidget, QMessageBox
 from PySide6.QtGui import QIcon, QAction
-from PySide6.QtCore import QDateTime
-from widgets import TreeWidget, PushButton, GridLayout, Dialog
+from PySide6.QtCore import QDateTime, QTimer
+from widgets import TreeView, PushButton, GridLayout, Dialog
+from audiobook import Audiobook
+from library import Library
+from thumbnails import ThumbnailCache
+from tracer import Tracer
 import sys, os
 
 
@@ -32,27 +36,47 @@ class AudiobookEncoderMainWindow(QMainWindow):
         about_m.setMenuRole(QAction.ApplicationSpecificRole)
         cental_widget: QWidget = QWidget(self)
         self.setCentralWidget(cental_widget)
-        self.tree_widget: TreeWidget = TreeWidget(dict(geometry=[10, 10,
-                                                                 self.window_size["x"]-20,
-                                                                 self.window_size["y"]-50]))
-        export_button: PushButton = PushButton(dict(name="Export",
-                                                    parent=self,
-                                                    fixed_height=33,
-                                                    tip="Batch export all audiobooks.",
-                                                    action="export"))
+        self.tree_view: TreeView = TreeView(dict(geometry=[10, 10,
+                                                           self.window_size["x"]-20,
+                                                           self.window_size["y"]-50]))
+        self.export_button: PushButton = PushButton(dict(name="Export",
+                                                         parent=self,
+                                                         fixed_height=33,
+                                                         tip="Batch export all audiobooks.",
+                                                         action="export"))
         grid_layout = GridLayout(dict(parent=cental_widget,
                                       margins=[10, 10, 10, 15],
                                       spacing=10))
-        grid_layout.addWidget(self.tree_widget, 0, 0)
-        grid_layout.addWidget(export_button, 1, 0)
+        grid_layout.addWidget(self.tree_view, 0, 0)
+        grid_layout.addWidget(self.export_button, 1, 0)
+        # offer to continue an export that was killed or cancelled
+        QTimer.singleShot(0, self.resume_export)
+
+    def resume_export(self) -> None:
+        """Ask to resume the unfinished jobs of the last export"""
+        unfinished: dict = Library.instance().read_export_jobs()
+        if not unfinished:
+            return
+        answer: QMessageBox.StandardButton = QMessageBox.question(
+            self, "Resume Export",
+            f"The last export has {len(unfinished)} unfinished audiobook(s).\nResume the export?")
+        if answer == QMessageBox.Yes:
+            self.export_button.resume_export()
+        else:
+            Audiobook().discard_export()
 
     def resizeEvent(self, event) -> None:
-        self.tree_widget.header().resizeSection(0, event.size().width()-130)
+        self.tree_view.header().resizeSection(0, event.size().width()-130)
 
 
 def main() -> None:
     app: QApplication = QApplication(sys.argv)
     app.setWindowIcon(QIcon(os.path.dirname(os.path.realpath(__file__)) + "/../icons/app_icon.png"))
+    # write pending library edits before quitting
+    app.aboutToQuit.connect(Library.instance().flush)
+    app.aboutToQuit.connect(ThumbnailCache.instance().save)
+    # trace file of AUDIOBOOK_TRACE, nothing is written without it
+    app.aboutToQuit.connect(Tracer.instance().save)
     mainwindow: QMainWindow = AudiobookEncoderMainWindow()
     mainwindow.show()
     sys.exit(app.exec())
@@ -0,0 +1,36 @@
+from PySide6.QtCore import QUrl, QFileInfo
+from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput
+
+
+class AudioPlayer(QMediaPlayer):
+    """Audioplayer plays audiofiles"""
+    def __init__(self, parent) -> None:
+        super().__init__()
+        self.setParent(parent)
+        self.audio_output: QAudioOutput = QAudioOutput(parent)
+        self.setAudioOutput(self.audio_output)
+        self.playing_state: bool = False
+
+    def play_audio(self, path: str) -> None:
+        """Start, stop and switch files"""
+        if not self.validate_file(path):
+            return
+        if self.playbackState() == QMediaPlayer.StoppedState:
+            self.setSource(QUrl.fromLocalFile(path))
+            self.play()
+            self.playing_state = True
+        elif path not in self.source().path():
+            # switch file without stopping
+            self.setSource(QUrl.fromLocalFile(path))
+            self.play()
+            self.playing_state = True
+        else:
+            self.stop()
+            self.playing_state = False
+
+    def validate_file(self, path: str) -> bool:
+        """Check for valid files (mp3, exists)"""
+        if (not path.endswith(".mp3") or
+           not QFileInfo(path).exists()):
+            return False
+        return True
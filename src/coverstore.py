@@ -0,0 +1,121 @@
+import hashlib, os, threading
+from typing import TYPE_CHECKING
+from PySide6.QtCore import Qt, QBuffer, QIODevice
+from probe import CoverHandle
+from tracer import Tracer
+if TYPE_CHECKING:
+    from PySide6.QtGui import QImage
+
+
+class CoverStore():
+    """Cover images saved by sha1 of their bytes
+    JPEG and PNG covers are kept as they are, identical art of several audiobooks
+    is saved once. Other formats are converted to PNG.
+    QtGui is only loaded to convert or scale covers, headless exports of JPEG and
+    PNG covers run on QtCore alone.
+    args: path = cover directory
+    """
+    # magic bytes: file extension
+    formats: dict[bytes, str] = {b"\xff\xd8\xff": "jpg",
+                                 b"\x89PNG\r\n\x1a\n": "png"}
+    _instance: "CoverStore | None" = None
+
+    def __init__(self, path: str = "") -> None:
+        self.cover_path: str = path or os.path.dirname(os.path.realpath(__file__)) + "/covers"
+
+    @classmethod
+    def instance(cls, path: str = "") -> "CoverStore":
+        """Shared store
+        args: path = cover directory, only used when the shared store is created
+        """
+        if cls._instance is None:
+            cls._instance = cls(path)
+        return cls._instance
+
+    @classmethod
+    def image_format(cls, data: bytes) -> str:
+        """File extension of JPEG or PNG bytes, empty for other formats"""
+        for magic, extension in cls.formats.items():
+            if data.startswith(magic):
+                return extension
+        return ""
+
+    @staticmethod
+    def encode(image: "QImage", extension: str) -> bytes:
+        """Encode an image as jpg or png"""
+        buffer: QBuffer = QBuffer()
+        buffer.open(QIODevice.WriteOnly)
+        with Tracer.instance().span("encode cover", format=extension, size=[image.width(), image.height()]):
+            image.save(buffer, extension.upper(), 95 if extension == "jpg" else -1)
+        return bytes(buffer.data())
+
+    def path(self, digest: str) -> str:
+        """Stored cover of a digest, empty if it is not in the store"""
+        for extension in self.formats.values():
+            path: str = f"{self.cover_path}/{digest}.{extension}"
+            if os.path.exists(path):
+                return path
+        return ""
+
+    def add(self, data: bytes, digest: str = "") -> str:
+        """Store cover bytes and return their path
+        args: digest = sha1 of data if it is already known
+        """
+        digest = digest or hashlib.sha1(data).hexdigest()
+        path: str = self.path(digest)
+        if path:
+            return path
+        extension: str = self.image_format(data)
+        if not extension:
+            data, extension = self.convert(data), "png"
+            if not data:
+                return ""
+        os.makedirs(self.cover_path, exist_ok=True)
+        path = f"{self.cover_path}/{digest}.{extension}"
+        # parallel imports may store the same cover
+        temp_path: str = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temp_path, "wb") as cover_file:
+            cover_file.write(data)
+        os.replace(temp_path, path)
+        return path
+
+    def add_handle(self, cover_handle: CoverHandle) -> str:
+        """Store an embedded cover, its bytes are only read if the store misses them"""
+        if not cover_handle:
+            return ""
+        return self.path(cover_handle.digest) or self.add(cover_handle.read(), cover_handle.digest)
+
+    def read(self, path: str) -> tuple[bytes, str]:
+        """Cover bytes and extension, other formats than JPEG and PNG are converted to PNG"""
+        with open(path, "rb") as cover_file:
+            data: bytes = cover_file.read()
+        extension: str = self.image_format(data)
+        if extension:
+            return data, extension
+        return self.convert(data), "png"
+
+    @classmethod
+    def convert(cls, data: bytes) -> bytes:
+        """Image bytes of any format as png, empty if they are no image"""
+        from PySide6.QtGui import QImage
+        image: QImage = QImage.fromData(data)
+        return b"" if image.isNull() else cls.encode(image, "png")
+
+    @classmethod
+    def scaled(cls, data: bytes, extension: str, size: int) -> bytes:
+        """Cover bytes scaled down to a longest edge of size, unchanged if they are smaller"""
+        from PySide6.QtGui import QImage
+        image: QImage = QImage.fromData(data)
+        if max(image.width(), image.height()) <= size:
+            return data
+        return cls.encode(image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation), extension)
+
+    def square(self, path: str) -> str:
+        """Squared cover, a new file in the store unless the cover is square already"""
+        from PySide6.QtGui import QImage
+        data, extension = self.read(path)
+        image: QImage = QImage.fromData(data)
+        if image.width() == image.height():
+            return path
+        size: int = max(image.width(), image.height())
+        return self.add(self.encode(image.scaled(size, size), extension))
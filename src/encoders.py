@@ -0,0 +1,134 @@
+import os, sys, time, argparse
+from abc import ABC, abstractmethod
+from array import array
+from m4b import M4b, AudioTrack
+
+
+class Encoder(ABC):
+    """Encoder backend of the export
+    Backends build the encoder command line, recognize progress in its output
+    and check the written file. Backends without command can't be created.
+    """
+    name: str = ""
+
+    @abstractmethod
+    def command(self, export_file: str, files: list[dict], settings: list[str]) -> list[str]:
+        """Command encoding files to export_file
+        args: files = [dict(file, duration)]
+              settings = [bitrate, channels, sample_rate] from Audiobook.export_settings
+        """
+
+    def progress(self, line: str, files: list[dict]) -> int | None:
+        """Index of the file the encoder started with, None for other output lines"""
+        for index, e_file in enumerate(files):
+            if e_file["file"] in line:
+                return index
+        return None
+
+    def validate(self, export_file: str) -> None:
+        """Raise ValueError if export_file is no audiobook with a sound track"""
+        if not os.path.exists(export_file) or not os.path.getsize(export_file):
+            raise ValueError(f"{self.name} wrote no file: {export_file}")
+        AudioTrack(export_file)
+
+    @staticmethod
+    def create(name: str, **kwargs) -> "Encoder":
+        """Encoder backend by name"""
+        backends: dict[str, type[Encoder]] = {e.name: e for e in (AbbinderEncoder, StubEncoder)}
+        if not name in backends:
+            raise ValueError(f"Unknown encoder \"{name}\", use one of {', '.join(backends)}")
+        return backends[name](**kwargs)
+
+
+class AbbinderEncoder(Encoder):
+    """Abbinder, the macOS AudioToolbox encoder
+    args: path = abbinder executable
+    """
+    name: str = "abbinder"
+
+    def __init__(self, path: str = "") -> None:
+        self.path: str = path or os.path.dirname(os.path.realpath(__file__)) + "/abbinder"
+
+    def command(self, export_file: str, files: list[dict], settings: list[str]) -> list[str]:
+        bitrate, channels, sample_rate = settings
+        return [self.path,                  # executable path
+                "-sv",                      # skip errors, print infos
+                "-b", bitrate,              # in KBps
+                "-r", sample_rate,          # (44100 default), 48000
+                "-c", channels,             # 1, (2 default)
+                "-E", "%N",                 # chapter by file: %N -> numbered
+                export_file,                # export path
+                *[e["file"] for e in files]] # source files
+
+
+class StubEncoder(Encoder):
+    """Deterministic encoder for machines without abbinder
+    Writes a valid m4b with zero filled AAC frames and a chapter per file, taking
+    duration / realtime seconds like a real encoder would.
+    args: realtime = encoded audio seconds per second, 0 writes at once
+    """
+    name: str = "stub"
+
+    def __init__(self, realtime: float = 100.0) -> None:
+        self.realtime: float = realtime
+
+    def command(self, export_file: str, files: list[dict], settings: list[str]) -> list[str]:
+        bitrate, channels, sample_rate = settings
+        return [sys.executable, os.path.realpath(__file__), self.name,
+                "--bitrate", bitrate.split()[0],
+                "--channels", channels,
+                "--sample-rate", sample_rate,
+                "--realtime", str(self.realtime),
+                export_file,
+                *[f"{e['duration']}:{e['file']}" for e in files]]
+
+    @staticmethod
+    def encode(export_file: str, files: list[str], bitrate: int, channels: int,
+               sample_rate: int, realtime: float) -> None:
+        """Write the stub m4b, prints a line per started file like abbinder -v
+        args: files = ["duration:path"]
+        """
+        durations: list[float] = [float(e.split(":", 1)[0]) for e in files]
+        # AAC frames of 1024 samples plus the 2112 samples encoder delay
+        frames: int = int(sum(durations) * sample_rate / 1024) + 4
+        frame_size: int = max(8, bitrate * 1000 // 8 * 1024 // sample_rate)
+        chunk: int = 20
+        samples_per_chunk: array = array("I", [chunk] * (frames // chunk) + ([frames % chunk] if frames % chunk else []))
+        chapters: list[tuple[float, str]] = []
+        start: float = 0
+        started: float = time.monotonic()
+        for index, (duration, e_file) in enumerate(zip(durations, files), 1):
+            print(f"Adding {e_file.split(':', 1)[1]}", flush=True)
+            chapters.append((start, str(index)))
+            start += duration
+            if realtime:
+                time.sleep(max(0.0, started + start / realtime - time.monotonic()))
+        movie_timescale: int = 600
+        M4b.write(export_file, dict(ftyp=M4b.ftyp,
+                                    stsd=M4b.aac_stsd(sample_rate, channels, bitrate * 1000),
+                                    timescale=sample_rate,
+                                    movie_timescale=movie_timescale,
+                                    stts=[(frames, 1024)],
+                                    edits=[(round(sum(durations) * movie_timescale), 2112)],
+                                    sample_sizes=array("I", [frame_size]) * frames,
+                                    samples_per_chunk=samples_per_chunk,
+                                    chunk_sizes=[e * frame_size for e in samples_per_chunk]),
+                  (bytes(e * frame_size) for e in samples_per_chunk), chapters)
+
+    @staticmethod
+    def main(argv: list[str]) -> None:
+        parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Stub audiobook encoder")
+        parser.add_argument("--bitrate", type=int, default=128)
+        parser.add_argument("--channels", type=int, default=2)
+        parser.add_argument("--sample-rate", type=int, default=44100)
+        parser.add_argument("--realtime", type=float, default=100.0)
+        parser.add_argument("export_file")
+        parser.add_argument("files", nargs="+")
+        args: argparse.Namespace = parser.parse_args(argv)
+        StubEncoder.encode(args.export_file, args.files, args.bitrate, args.channels,
+                           args.sample_rate, args.realtime)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == [StubEncoder.name]:
+        StubEncoder.main(sys.argv[2:])
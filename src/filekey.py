@@ -0,0 +1,7 @@
+import os
+
+
+def file_key(path: str) -> list[int]:
+    """Size and modification time identifying a file version, raises OSError for missing files"""
+    stat: os.stat_result = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
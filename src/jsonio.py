@@ -4,10 +4,10 @@ import json
 class JsonIO:
     """This class edits all necessary custom user information."""
     @staticmethod
-    def write(data: dict, path: str) -> bool:
+    def write(data: dict, path: str, indent: int | None = 4) -> bool:
         """Write json file."""
         with open(path, "w") as json_file:
-            json.dump(data, json_file, indent=4)
+            json.dump(data, json_file, indent=indent)
         return True
 
     @staticmethod
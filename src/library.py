@@ -0,0 +1,399 @@
+import json, os, sqlite3
+from threading import local, Lock, Timer
+from filekey import file_key
+from jsonio import JsonIO
+
+
+class LibraryStore():
+    """SQLite store for audiobooks, their tracks and author presets
+    Books and tracks are read as the same dicts audiobooks.json used to hold,
+    writes only touch the rows that changed.
+    args: path = sqlite database file
+    """
+    book_columns: list[str] = ["title", "author", "genre", "cover", "duration",
+                               "destination", "quality", "export"]
+    track_columns: list[str] = ["file", "duration", "bitrate", "channels", "sample_rate", "vbr"]
+    schema: str = """
+        CREATE TABLE IF NOT EXISTS books (
+            key TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            title TEXT NOT NULL DEFAULT '',
+            author TEXT NOT NULL DEFAULT '',
+            genre TEXT NOT NULL DEFAULT '',
+            cover TEXT NOT NULL DEFAULT '',
+            track INTEGER NOT NULL DEFAULT 1,
+            track_total INTEGER NOT NULL DEFAULT 1,
+            duration INTEGER NOT NULL DEFAULT 0,
+            destination TEXT NOT NULL DEFAULT '',
+            quality INTEGER NOT NULL DEFAULT 0,
+            export INTEGER NOT NULL DEFAULT 1,
+            extra TEXT NOT NULL DEFAULT '{}');
+        CREATE TABLE IF NOT EXISTS tracks (
+            book_key TEXT NOT NULL REFERENCES books(key) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            file TEXT NOT NULL,
+            duration INTEGER NOT NULL DEFAULT 0,
+            bitrate INTEGER,
+            channels INTEGER,
+            sample_rate INTEGER,
+            vbr INTEGER,
+            extra TEXT NOT NULL DEFAULT '{}',
+            PRIMARY KEY (book_key, position));
+        CREATE TABLE IF NOT EXISTS presets (
+            name TEXT PRIMARY KEY,
+            data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS exports (
+            file TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            audio TEXT NOT NULL DEFAULT '');
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            key TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            state TEXT NOT NULL,
+            data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL);
+    """
+    # one connection per thread and database
+    _connections: local = local()
+    _initialized: set[str] = set()
+    _init_lock: Lock = Lock()
+
+    def __init__(self, path: str = "") -> None:
+        self.store_path: str = path or os.path.dirname(os.path.realpath(__file__)) + "/audiobooks.db"
+        with self._init_lock:
+            if self.store_path not in self._initialized:
+                self.initialize()
+                self._initialized.add(self.store_path)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the calling thread"""
+        connections: dict = self._connections.__dict__.setdefault("connections", {})
+        if self.store_path not in connections:
+            connection: sqlite3.Connection = sqlite3.connect(self.store_path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA foreign_keys = ON")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connections[self.store_path] = connection
+        return connections[self.store_path]
+
+    def initialize(self) -> None:
+        """Create tables and migrate the json files once"""
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(self.schema)
+        # exports of older databases have no audio fingerprint
+        export_columns: list[str] = [e["name"] for e in self.connection.execute("PRAGMA table_info(exports)")]
+        if "audio" not in export_columns:
+            self.connection.execute("ALTER TABLE exports ADD COLUMN audio TEXT NOT NULL DEFAULT ''")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS exports_audio ON exports(audio)")
+        migrated = self.connection.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()
+        if migrated:
+            return
+        folder: str = os.path.dirname(self.store_path)
+        with self.connection:
+            for json_name, write in [["audiobooks.json", self.insert_books],
+                                     ["presets.json", self.insert_presets]]:
+                json_path: str = f"{folder}/{json_name}"
+                if os.path.exists(json_path):
+                    write(JsonIO.read(json_path))
+            self.connection.execute("INSERT INTO meta VALUES ('migrated', '1')")
+
+    # books
+    def book_from_row(self, row: sqlite3.Row, tracks: list[dict] | None) -> dict:
+        """Audiobook dict like in audiobooks.json
+        without tracks the dict has a file_count instead of files
+        """
+        book: dict = {e_column: row[e_column] for e_column in self.book_columns}
+        book.update({"export": bool(row["export"]),
+                     "tracknumber": [row["track"], row["track_total"]]})
+        if tracks is None:
+            book.update({"file_count": row["file_count"]})
+        else:
+            book.update({"files": tracks})
+        book.update(json.loads(row["extra"]))
+        return book
+
+    def track_from_row(self, row: sqlite3.Row) -> dict:
+        """Track dict, unknown stream infos are left out"""
+        track: dict = {e_column: row[e_column] for e_column in self.track_columns
+                                               if row[e_column] is not None}
+        if "vbr" in track:
+            track.update({"vbr": bool(track["vbr"])})
+        if row["extra"] != "{}":
+            track.update(json.loads(row["extra"]))
+        return track
+
+    def read_books(self, keys: list[str] | None = None, files: bool = True) -> dict:
+        """Read all or the given audiobooks in library order
+        args: files = read tracks too, otherwise only count them
+        """
+        if keys is not None and not keys:
+            return {}
+        where: str = f"WHERE key IN ({','.join('?' * len(keys))})" if keys is not None else ""
+        if not files:
+            books: list[sqlite3.Row] = self.connection.execute(
+                "SELECT *, (SELECT COUNT(*) FROM tracks WHERE book_key = key) AS file_count "
+                f"FROM books {where} ORDER BY position", keys or []).fetchall()
+            return {e_book["key"]: self.book_from_row(e_book, None) for e_book in books}
+        books: list[sqlite3.Row] = self.connection.execute(
+            f"SELECT * FROM books {where} ORDER BY position", keys or []).fetchall()
+        tracks: dict[str, list[dict]] = {e_book["key"]: [] for e_book in books}
+        track_rows: list[sqlite3.Row] = self.connection.execute(
+            f"SELECT * FROM tracks {where.replace('key', 'book_key')} ORDER BY book_key, position",
+            keys or []).fetchall()
+        for e_row in track_rows:
+            tracks[e_row["book_key"]].append(self.track_from_row(e_row))
+        return {e_book["key"]: self.book_from_row(e_book, tracks[e_book["key"]]) for e_book in books}
+
+    def read_book(self, key: str) -> dict:
+        """Read a single audiobook"""
+        return self.read_books([key]).get(key, {})
+
+    def read_tracks(self, key: str) -> list[dict]:
+        """Read the tracks of an audiobook"""
+        return [self.track_from_row(e_row) for e_row in self.connection.execute(
+            "SELECT * FROM tracks WHERE book_key = ? ORDER BY position", [key])]
+
+    def next_key(self) -> str:
+        """Unused audiobook key"""
+        keys: list[str] = [e[0] for e in self.connection.execute("SELECT key FROM books")]
+        numbers: list[int] = [int(e.rsplit("_", 1)[-1]) for e in keys if e.rsplit("_", 1)[-1].isdigit()]
+        return f"audiobook_{max(numbers) + 1 if numbers else 0}"
+
+    def split_book(self, book: dict) -> tuple[list, str]:
+        """Column values and extra json of an audiobook dict"""
+        tracknumber: list[int] = book.get("tracknumber", [1, 1])
+        values: list = [book.get(e_column, 0 if e_column in ["duration", "quality"] else "")
+                        for e_column in self.book_columns]
+        values[self.book_columns.index("export")] = int(book.get("export", True))
+        extra: dict = {e_key: e_value for e_key, e_value in book.items()
+                                      if e_key not in [*self.book_columns, "tracknumber", "files"]}
+        return [*values, tracknumber[0], tracknumber[1]], json.dumps(extra)
+
+    def insert_books(self, data: dict) -> None:
+        """Append audiobooks with their tracks"""
+        position: int = self.connection.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM books").fetchone()[0]
+        for e_key, e_book in data.items():
+            values, extra = self.split_book(e_book)
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO books (key, position, {', '.join(self.book_columns)}, track, track_total, extra) "
+                f"VALUES (?, ?, {', '.join('?' * len(self.book_columns))}, ?, ?, ?)",
+                [e_key, position, *values, extra])
+            self.insert_tracks(e_key, e_book.get("files", []))
+            position += 1
+
+    def insert_tracks(self, key: str, files: list[dict]) -> None:
+        """Replace all tracks of an audiobook"""
+        self.connection.execute("DELETE FROM tracks WHERE book_key = ?", [key])
+        rows: list[list] = []
+        for position, e_file in enumerate(files):
+            extra: dict = {e_key: e_value for e_key, e_value in e_file.items() if e_key not in self.track_columns}
+            rows.append([key, position, *[e_file.get(e_column) for e_column in self.track_columns], json.dumps(extra)])
+        self.connection.executemany(
+            f"INSERT INTO tracks (book_key, position, {', '.join(self.track_columns)}, extra) "
+            f"VALUES (?, ?, {', '.join('?' * len(self.track_columns))}, ?)", rows)
+
+    def add_books(self, data: dict) -> None:
+        """Append audiobooks in one transaction"""
+        with self.connection:
+            self.insert_books(data)
+
+    def write_books(self, data: dict) -> None:
+        """Replace the whole library"""
+        with self.connection:
+            self.connection.execute("DELETE FROM books")
+            self.insert_books(data)
+
+    def update_book(self, key: str, fields: dict) -> None:
+        """Update single fields of an audiobook"""
+        with self.connection:
+            row: sqlite3.Row | None = self.connection.execute(
+                "SELECT extra FROM books WHERE key = ?", [key]).fetchone()
+            if row is None:
+                return
+            extra: dict = json.loads(row["extra"])
+            for e_field, e_value in fields.items():
+                if e_field == "files":
+                    self.insert_tracks(key, e_value)
+                elif e_field == "tracknumber":
+                    self.connection.execute("UPDATE books SET track = ?, track_total = ? WHERE key = ?",
+                                            [*e_value, key])
+                elif e_field in self.book_columns:
+                    e_value = int(e_value) if e_field == "export" else e_value
+                    self.connection.execute(f"UPDATE books SET {e_field} = ? WHERE key = ?", [e_value, key])
+                else:
+                    extra.update({e_field: e_value})
+            self.connection.execute("UPDATE books SET extra = ? WHERE key = ?", [json.dumps(extra), key])
+
+    def delete_books(self, keys: list[str]) -> None:
+        """Delete audiobooks with their tracks"""
+        with self.connection:
+            self.connection.executemany("DELETE FROM books WHERE key = ?", [[e_key] for e_key in keys])
+
+    def delete_tracks(self, key: str, files: list[str]) -> None:
+        """Delete tracks by file path and update the audiobook duration"""
+        with self.connection:
+            self.connection.executemany("DELETE FROM tracks WHERE book_key = ? AND file = ?",
+                                        [[key, e_file] for e_file in files])
+            self.connection.execute("UPDATE books SET duration = (SELECT COALESCE(SUM(duration), 0) "
+                                    "FROM tracks WHERE book_key = ?) WHERE key = ?", [key, key])
+
+    # presets
+    def read_presets(self) -> dict:
+        """Read all author presets"""
+        return {e_row["name"]: json.loads(e_row["data"])
+                for e_row in self.connection.execute("SELECT * FROM presets ORDER BY name")}
+
+    def insert_presets(self, data: dict) -> None:
+        """Add or replace author presets"""
+        self.connection.executemany("INSERT OR REPLACE INTO presets VALUES (?, ?)",
+                                    [[e_name, json.dumps(e_data)] for e_name, e_data in data.items()])
+
+    def write_presets(self, data: dict) -> None:
+        """Add or replace author presets in one transaction"""
+        with self.connection:
+            self.insert_presets(data)
+
+    def delete_preset(self, name: str) -> None:
+        """Delete an author preset"""
+        with self.connection:
+            self.connection.execute("DELETE FROM presets WHERE name = ?", [name])
+
+    # exports
+    def read_export(self, file: str) -> dict | None:
+        """Fingerprints, size and mtime_ns of an exported file"""
+        row: sqlite3.Row | None = self.connection.execute("SELECT * FROM exports WHERE file = ?", [file]).fetchone()
+        return dict(row) if row else None
+
+    def read_exports(self, audio: str) -> list[dict]:
+        """Exported files with the same audio fingerprint"""
+        rows: list[sqlite3.Row] = self.connection.execute("SELECT * FROM exports WHERE audio = ?", [audio]).fetchall()
+        return [dict(e) for e in rows]
+
+    def write_export(self, file: str, fingerprint: str, audio: str = "") -> None:
+        """Remember the fingerprints of an exported file in its current version
+        args: audio = fingerprint of the encoded audio only
+        """
+        size, mtime_ns = file_key(file)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO exports VALUES (?, ?, ?, ?, ?)",
+                                    [file, fingerprint, size, mtime_ns, audio])
+
+    def delete_export(self, file: str) -> None:
+        """Forget an exported file"""
+        with self.connection:
+            self.connection.execute("DELETE FROM exports WHERE file = ?", [file])
+
+    # export journal
+    def write_export_jobs(self, data: dict) -> None:
+        """Replace the journal with pending jobs of an export, unfinished jobs are added to it by Audiobook.export
+        args: data = {export key: audiobook dict with files}
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM export_jobs")
+            self.connection.executemany("INSERT INTO export_jobs VALUES (?, ?, 'pending', ?)",
+                                        [[e_key, position, json.dumps(e_data)]
+                                         for position, (e_key, e_data) in enumerate(data.items())])
+
+    def read_export_jobs(self, states: tuple[str, ...] = ("pending", "running")) -> dict:
+        """Journaled jobs in one of states in export order"""
+        rows: list[sqlite3.Row] = self.connection.execute(
+            f"SELECT key, data FROM export_jobs WHERE state IN ({', '.join('?' * len(states))}) ORDER BY position",
+            states).fetchall()
+        return {e["key"]: json.loads(e["data"]) for e in rows}
+
+    def update_export_job(self, key: str, state: str) -> None:
+        """Set the state of a journaled job: pending, running, done or failed"""
+        with self.connection:
+            self.connection.execute("UPDATE export_jobs SET state = ? WHERE key = ?", [state, key])
+
+    def clear_export_jobs(self) -> None:
+        """Empty the journal"""
+        with self.connection:
+            self.connection.execute("DELETE FROM export_jobs")
+
+
+class Library(LibraryStore):
+    """In-process library with write-behind for field edits
+    update_book() only marks fields dirty, edits of the same audiobook are coalesced
+    and written after idle_timeout seconds without edits. Every other read or write
+    flushes pending edits first.
+    args: path = sqlite database file
+          idle_timeout = seconds without edits before dirty fields are written
+    """
+    _instance: "Library | None" = None
+
+    def __init__(self, path: str = "", idle_timeout: float = 1.0) -> None:
+        super().__init__(path)
+        self.idle_timeout: float = idle_timeout
+        self.dirty: dict[str, dict] = {}
+        self.dirty_lock: Lock = Lock()
+        # held while dirty fields are written, flushing readers wait for a running write
+        self.flush_lock: Lock = Lock()
+        self.flush_timer: Timer | None = None
+
+    @classmethod
+    def instance(cls, path: str = "") -> "Library":
+        """Shared library of this process
+        args: path = sqlite database file, only used when the shared library is created
+        """
+        if cls._instance is None:
+            cls._instance = cls(path)
+        return cls._instance
+
+    def update_book(self, key: str, fields: dict) -> None:
+        """Mark fields dirty and restart the idle timer"""
+        with self.dirty_lock:
+            self.dirty.setdefault(key, {}).update(fields)
+            if self.flush_timer:
+                self.flush_timer.cancel()
+            self.flush_timer = Timer(self.idle_timeout, self.flush)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+
+    def flush(self) -> None:
+        """Write all dirty fields, returns once edits taken by another thread are written too"""
+        with self.flush_lock:
+            with self.dirty_lock:
+                if self.flush_timer:
+                    self.flush_timer.cancel()
+                    self.flush_timer = None
+                dirty: dict[str, dict] = self.dirty
+                self.dirty = {}
+            for key, fields in dirty.items():
+                super().update_book(key, fields)
+
+    def read_books(self, keys: list[str] | None = None, files: bool = True) -> dict:
+        self.flush()
+        return super().read_books(keys, files)
+
+    def read_tracks(self, key: str) -> list[dict]:
+        self.flush()
+        return super().read_tracks(key)
+
+    def next_key(self) -> str:
+        self.flush()
+        return super().next_key()
+
+    def add_books(self, data: dict) -> None:
+        self.flush()
+        super().add_books(data)
+
+    def write_books(self, data: dict) -> None:
+        # the whole library is replaced, pending edits are outdated
+        with self.flush_lock:
+            with self.dirty_lock:
+                self.dirty.clear()
+            super().write_books(data)
+
+    def delete_books(self, keys: list[str]) -> None:
+        self.flush()
+        super().delete_books(keys)
+
+    def delete_tracks(self, key: str, files: list[str]) -> None:
+        self.flush()
+        super().delete_tracks(key, files)
@@ -0,0 +1,437 @@
+import struct, sys
+from array import array
+from collections.abc import Iterable, Iterator
+from typing import BinaryIO
+
+
+def box(box_type: bytes, *payloads: bytes) -> bytes:
+    """Mp4 box with 32 bit size"""
+    payload: bytes = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type: bytes, version: int, flags: int, *payloads: bytes) -> bytes:
+    """Mp4 box with version and flags"""
+    return box(box_type, struct.pack(">I", version << 24 | flags), *payloads)
+
+
+def big_endian(values: array) -> bytes:
+    """Array items as big endian bytes"""
+    if sys.byteorder == "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def from_big_endian(typecode: str, data: bytes) -> array:
+    """Array from big endian bytes"""
+    values: array = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values
+
+
+def children(data: bytes, start: int = 0, end: int | None = None) -> Iterator[tuple[bytes, int, int]]:
+    """Type, payload start and end of the boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, start)
+        header: int = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, start + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            return
+        yield box_type, start + header, start + size
+        start += size
+
+
+def child(data: bytes, path: list[bytes], start: int = 0, end: int | None = None) -> tuple[int, int] | None:
+    """Payload start and end of the first box at path"""
+    for box_type, payload_start, payload_end in children(data, start, end):
+        if box_type != path[0]:
+            continue
+        if len(path) == 1:
+            return payload_start, payload_end
+        return child(data, path[1:], payload_start, payload_end)
+    return None
+
+
+def file_boxes(file: BinaryIO) -> Iterator[tuple[bytes, int, int]]:
+    """Top level boxes of a mp4 file, without reading their payload"""
+    file.seek(0, 2)
+    end: int = file.tell()
+    start: int = 0
+    while start + 8 <= end:
+        file.seek(start)
+        header: bytes = file.read(16)
+        size, box_type = struct.unpack_from(">I4s", header)
+        header_size: int = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - start
+        if size < header_size:
+            return
+        yield box_type, start + header_size, start + size
+        start += size
+
+
+def descriptor(data: bytes, start: int) -> tuple[int, int, int]:
+    """Tag, payload start and end of an MPEG-4 descriptor with its variable length size"""
+    tag: int = data[start]
+    size: int = 0
+    start += 1
+    for _ in range(4):
+        size = size << 7 | data[start] & 0x7f
+        start += 1
+        if not data[start - 1] & 0x80:
+            break
+    return tag, start, start + size
+
+
+def audio_specific_config(esds: bytes) -> bytes:
+    """AudioSpecificConfig of the payload of an esds box, empty if it has none"""
+    start: int = 4
+    while start < len(esds):
+        tag, payload_start, payload_end = descriptor(esds, start)
+        if tag == 3:
+            # ES_Descriptor: id, flags and optional fields before its sub descriptors
+            flags: int = esds[payload_start + 2]
+            start = payload_start + 3 + (2 if flags & 0x80 else 0) + (2 if flags & 0x20 else 0)
+            if flags & 0x40:
+                start += 1 + esds[start]
+        elif tag == 4:
+            # DecoderConfigDescriptor: object type, stream type, buffer size and bitrates
+            start = payload_start + 13
+        elif tag == 5:
+            return esds[payload_start:payload_end]
+        else:
+            start = payload_end
+    return b""
+
+
+class AudioTrack():
+    """Sample table of the sound track of a mp4 file
+    args: path = mp4 or m4b file
+    """
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        # payload of the top level boxes without the sample data
+        boxes: dict[bytes, bytes] = {}
+        with open(path, "rb") as file:
+            for box_type, start, end in file_boxes(file):
+                if box_type in (b"ftyp", b"moov"):
+                    file.seek(start)
+                    boxes.update({box_type: file.read(end - start)})
+        self.ftyp: bytes = boxes.get(b"ftyp", b"")
+        moov: bytes = boxes.get(b"moov", b"")
+        mvhd: tuple[int, int] | None = child(moov, [b"mvhd"])
+        if mvhd is None:
+            raise ValueError(f"No movie header in {path}")
+        self.movie_timescale: int = struct.unpack_from(">I", moov, mvhd[0] + (20 if moov[mvhd[0]] else 12))[0]
+        for box_type, start, end in children(moov):
+            if box_type != b"trak":
+                continue
+            hdlr: tuple[int, int] | None = child(moov, [b"mdia", b"hdlr"], start, end)
+            if hdlr and moov[hdlr[0] + 8:hdlr[0] + 12] == b"soun":
+                self.read_track(moov, start, end)
+                return
+        raise ValueError(f"No sound track in {path}")
+
+    def read_track(self, moov: bytes, start: int, end: int) -> None:
+        """Read timescale, sample description and sample table"""
+        mdhd: tuple[int, int] = child(moov, [b"mdia", b"mdhd"], start, end)
+        self.timescale: int = struct.unpack_from(">I", moov, mdhd[0] + (20 if moov[mdhd[0]] else 12))[0]
+        stbl: tuple[int, int] = child(moov, [b"mdia", b"minf", b"stbl"], start, end)
+        table = lambda name: child(moov, [name], *stbl)
+        # whole stsd box, it is copied as it is
+        for box_type, payload_start, payload_end in children(moov, *stbl):
+            if box_type == b"stsd":
+                self.stsd: bytes = moov[payload_start - 8:payload_end]
+        stts: tuple[int, int] = table(b"stts")
+        entries: array = from_big_endian("I", moov[stts[0] + 8:stts[1]])
+        self.stts: list[tuple[int, int]] = list(zip(entries[0::2], entries[1::2]))
+        stsz: tuple[int, int] = table(b"stsz")
+        sample_size, sample_count = struct.unpack_from(">II", moov, stsz[0] + 4)
+        self.sample_sizes: array = (from_big_endian("I", moov[stsz[0] + 12:stsz[0] + 12 + 4 * sample_count])
+                                    if not sample_size else array("I", [sample_size]) * sample_count)
+        stco: tuple[int, int] | None = table(b"stco")
+        if stco is not None:
+            offsets: array = from_big_endian("I", moov[stco[0] + 8:stco[1]])
+        else:
+            co64: tuple[int, int] = table(b"co64")
+            offsets = from_big_endian("Q", moov[co64[0] + 8:co64[1]])
+        stsc: tuple[int, int] = table(b"stsc")
+        runs: array = from_big_endian("I", moov[stsc[0] + 8:stsc[1]])
+        first_chunks: list[int] = list(runs[0::3]) + [len(offsets) + 1]
+        self.samples_per_chunk: array = array("I")
+        for run, samples in enumerate(runs[1::3]):
+            self.samples_per_chunk.extend([samples] * (first_chunks[run + 1] - first_chunks[run]))
+        # chunk offset and size in the file
+        self.chunks: list[tuple[int, int]] = []
+        sample: int = 0
+        for offset, samples in zip(offsets, self.samples_per_chunk):
+            self.chunks.append((offset, sum(self.sample_sizes[sample:sample + samples])))
+            sample += samples
+        # edit list in movie timescale, media_time -1 are empty edits
+        self.edits: list[tuple[int, int]] = []
+        elst: tuple[int, int] | None = child(moov, [b"edts", b"elst"], start, end)
+        if elst is not None:
+            version: int = moov[elst[0]]
+            entry_format: str = ">Qqhh" if version else ">Iihh"
+            count: int = struct.unpack_from(">I", moov, elst[0] + 4)[0]
+            for index in range(count):
+                duration, media_time, _rate, _fraction = struct.unpack_from(
+                    entry_format, moov, elst[0] + 8 + index * struct.calcsize(entry_format))
+                self.edits.append((duration, media_time))
+        if not [e for e in self.edits if e[1] >= 0]:
+            self.edits = [(self.duration * self.movie_timescale // self.timescale, 0)]
+
+    @property
+    def decoder_config(self) -> tuple[bytes, int, int, bytes]:
+        """What decoding depends on: codec, channels, sample rate and codec config
+        the codec config of AAC is the AudioSpecificConfig, buffer size and bitrates
+        of the esds box may differ between encoder runs. Other codecs keep their child boxes.
+        """
+        # stsd header, version and entry count, sample entry header and data reference index
+        entry: int = 16
+        codec: bytes = self.stsd[entry + 4:entry + 8]
+        sound_version: int = struct.unpack_from(">H", self.stsd, entry + 16)[0]
+        channels: int = struct.unpack_from(">H", self.stsd, entry + 24)[0]
+        sample_rate: int = struct.unpack_from(">I", self.stsd, entry + 32)[0] >> 16
+        entry_end: int = entry + struct.unpack_from(">I", self.stsd, entry)[0]
+        boxes_start: int = entry + 36 + {1: 16, 2: 36}.get(sound_version, 0)
+        esds: tuple[int, int] | None = child(self.stsd, [b"esds"], boxes_start, entry_end)
+        if esds is not None:
+            return codec, channels, sample_rate, audio_specific_config(self.stsd[esds[0]:esds[1]])
+        return codec, channels, sample_rate, self.stsd[boxes_start:entry_end]
+
+    @property
+    def duration(self) -> int:
+        """Media duration in track timescale"""
+        return sum(count * delta for count, delta in self.stts)
+
+    @property
+    def seconds(self) -> float:
+        """Played duration after the edit list"""
+        return sum(e[0] for e in self.edits if e[1] >= 0) / self.movie_timescale
+
+    def data(self, block_size: int = 1 << 20) -> Iterator[bytes]:
+        """Chunk data in order, neighbouring chunks are read at once"""
+        with open(self.path, "rb") as file:
+            ranges: list[list[int]] = []
+            for offset, size in self.chunks:
+                if ranges and ranges[-1][1] == offset:
+                    ranges[-1][1] += size
+                else:
+                    ranges.append([offset, offset + size])
+            for start, end in ranges:
+                file.seek(start)
+                while start < end:
+                    data: bytes = file.read(min(block_size, end - start))
+                    if not data:
+                        raise ValueError(f"Truncated sample data in {self.path}")
+                    start += len(data)
+                    yield data
+
+
+class M4b():
+    """Write m4b audiobooks with one sound track and chapters
+    Chapters are written as text track and as Nero chapters for players without chapter tracks.
+    """
+    matrix: bytes = struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+    ftyp: bytes = b"M4B \x00\x00\x02\x00M4B M4A mp42isom"
+    # chapter track timescale
+    chapter_timescale: int = 1000
+
+    @staticmethod
+    def concat(paths: list[str], path: str, chapters: list[tuple[float, str]]) -> None:
+        """Join encoded parts with the same decoder config without reencoding
+        the sample description of the first part is kept
+        args: chapters = [(start in seconds, title)]
+        """
+        tracks: list[AudioTrack] = [AudioTrack(e) for e in paths]
+        first: AudioTrack = tracks[0]
+        for track in tracks[1:]:
+            if track.decoder_config != first.decoder_config or track.timescale != first.timescale:
+                raise ValueError(f"{track.path} is encoded with other settings than {first.path}")
+        stts: list[tuple[int, int]] = []
+        edits: list[tuple[int, int]] = []
+        sample_sizes: array = array("I")
+        samples_per_chunk: array = array("I")
+        chunk_sizes: list[int] = []
+        media_offset: int = 0
+        for track in tracks:
+            for count, delta in track.stts:
+                if stts and stts[-1][1] == delta:
+                    stts[-1] = (stts[-1][0] + count, delta)
+                else:
+                    stts.append((count, delta))
+            # keep the encoder delay of every part out of the played range
+            for duration, media_time in track.edits:
+                if media_time >= 0:
+                    edits.append((duration * first.movie_timescale // track.movie_timescale,
+                                  media_time + media_offset))
+            media_offset += track.duration
+            sample_sizes.extend(track.sample_sizes)
+            samples_per_chunk.extend(track.samples_per_chunk)
+            chunk_sizes.extend([e[1] for e in track.chunks])
+        M4b.write(path, dict(ftyp=first.ftyp or M4b.ftyp,
+                             stsd=first.stsd,
+                             timescale=first.timescale,
+                             movie_timescale=first.movie_timescale,
+                             stts=stts,
+                             edits=edits,
+                             sample_sizes=sample_sizes,
+                             samples_per_chunk=samples_per_chunk,
+                             chunk_sizes=chunk_sizes),
+                  (e_data for e_track in tracks for e_data in e_track.data()), chapters)
+
+    @staticmethod
+    def write(path: str, track: dict, data: Iterable[bytes], chapters: list[tuple[float, str]]) -> None:
+        """Write a m4b with the moov box in front of the sample data
+        args: track = dict(ftyp, stsd, timescale, movie_timescale, stts, edits,
+                           sample_sizes, samples_per_chunk, chunk_sizes)
+              data = sample data of all chunks in order
+              chapters = [(start in seconds, title)]
+        """
+        movie_duration: int = sum(e[0] for e in track["edits"])
+        seconds: float = movie_duration / track["movie_timescale"]
+        chapters = [e for e in chapters if e[0] < seconds] or [(0.0, "1")]
+        titles: list[bytes] = [struct.pack(">H", len(e[1].encode())) + e[1].encode() for e in chapters]
+        audio_size: int = sum(track["chunk_sizes"])
+        ftyp: bytes = box(b"ftyp", track["ftyp"])
+        moov: bytes = M4b.moov(track, chapters, titles, 0)
+        # moov size does not depend on the chunk offsets
+        base: int = len(ftyp) + len(moov) + 16
+        moov = M4b.moov(track, chapters, titles, base)
+        with open(path, "wb") as file:
+            file.write(ftyp)
+            file.write(moov)
+            file.write(struct.pack(">I4sQ", 1, b"mdat", 16 + audio_size + sum(len(e) for e in titles)))
+            written: int = 0
+            for e_data in data:
+                file.write(e_data)
+                written += len(e_data)
+            if written != audio_size:
+                raise ValueError(f"Expected {audio_size} bytes of sample data, got {written}")
+            file.write(b"".join(titles))
+
+    @staticmethod
+    def moov(track: dict, chapters: list[tuple[float, str]], titles: list[bytes], base: int) -> bytes:
+        """Movie box with sound track, chapter track and Nero chapters"""
+        movie_timescale: int = track["movie_timescale"]
+        movie_duration: int = sum(e[0] for e in track["edits"])
+        chunk_offsets: array = array("Q")
+        offset: int = base
+        for size in track["chunk_sizes"]:
+            chunk_offsets.append(offset)
+            offset += size
+        stsc: array = array("I")
+        for chunk, samples in enumerate(track["samples_per_chunk"], 1):
+            if not stsc or stsc[-2] != samples:
+                stsc.extend([chunk, samples, 1])
+        stts: array = array("I", [e for e_entry in track["stts"] for e in e_entry])
+        audio: bytes = box(b"trak",
+            M4b.tkhd(1, 7, movie_duration, 0x0100),
+            box(b"tref", box(b"chap", struct.pack(">I", 2))),
+            box(b"edts", full_box(b"elst", 1, 0, struct.pack(">I", len(track["edits"])),
+                                  *[struct.pack(">Qqhh", duration, media_time, 1, 0)
+                                    for duration, media_time in track["edits"]])),
+            box(b"mdia",
+                M4b.mdhd(track["timescale"], sum(count * delta for count, delta in track["stts"])),
+                M4b.hdlr(b"soun", "SoundHandler"),
+                box(b"minf",
+                    full_box(b"smhd", 0, 0, struct.pack(">hH", 0, 0)),
+                    M4b.dinf(),
+                    box(b"stbl",
+                        track["stsd"],
+                        full_box(b"stts", 0, 0, struct.pack(">I", len(track["stts"])), big_endian(stts)),
+                        full_box(b"stsc", 0, 0, struct.pack(">I", len(stsc) // 3), big_endian(stsc)),
+                        M4b.stsz(track["sample_sizes"]),
+                        full_box(b"co64", 0, 0, struct.pack(">I", len(chunk_offsets)),
+                                 big_endian(chunk_offsets))))))
+        # chapter titles follow the sample data
+        chapter_ms: list[int] = [round(e[0] * M4b.chapter_timescale) for e in chapters]
+        chapter_ms.append(round(movie_duration * M4b.chapter_timescale / movie_timescale))
+        deltas: array = array("I", [e for row, start in enumerate(chapter_ms[:-1])
+                                      for e in (1, max(0, chapter_ms[row + 1] - start))])
+        text: bytes = box(b"trak",
+            M4b.tkhd(2, 0, movie_duration, 0),
+            box(b"mdia",
+                M4b.mdhd(M4b.chapter_timescale, chapter_ms[-1]),
+                M4b.hdlr(b"text", "ChapterHandler"),
+                box(b"minf",
+                    full_box(b"nmhd", 0, 0),
+                    M4b.dinf(),
+                    box(b"stbl",
+                        full_box(b"stsd", 0, 0, struct.pack(">I", 1), M4b.tx3g()),
+                        full_box(b"stts", 0, 0, struct.pack(">I", len(chapters)), big_endian(deltas)),
+                        full_box(b"stsc", 0, 0, struct.pack(">IIII", 1, 1, len(chapters), 1)),
+                        M4b.stsz(array("I", [len(e) for e in titles])),
+                        full_box(b"co64", 0, 0, struct.pack(">IQ", 1, offset))))))
+        udta: bytes = b""
+        if len(chapters) <= 255:
+            # Nero chapters, start in 100 ns units, titles up to 255 bytes
+            nero_titles: list[bytes] = [e[1].encode()[:255].decode(errors="ignore").encode() for e in chapters]
+            udta = box(b"udta", full_box(b"chpl", 1, 0, struct.pack(">IB", 0, len(chapters)),
+                *[struct.pack(">QB", round(start * 10000000), len(title)) + title
+                  for (start, _title), title in zip(chapters, nero_titles)]))
+        mvhd: bytes = full_box(b"mvhd", 1, 0, struct.pack(">QQIQIH10s", 0, 0, movie_timescale, movie_duration,
+                                                          0x00010000, 0x0100, bytes(10)),
+                               M4b.matrix, bytes(24), struct.pack(">I", 3))
+        return box(b"moov", mvhd, audio, text, udta)
+
+    @staticmethod
+    def tkhd(track_id: int, flags: int, duration: int, volume: int) -> bytes:
+        return full_box(b"tkhd", 1, flags, struct.pack(">QQIIQ8xhhhH", 0, 0, track_id, 0, duration,
+                                                       0, 0, volume, 0),
+                        M4b.matrix, struct.pack(">II", 0, 0))
+
+    @staticmethod
+    def mdhd(timescale: int, duration: int) -> bytes:
+        # language und
+        return full_box(b"mdhd", 1, 0, struct.pack(">QQIQHH", 0, 0, timescale, duration, 0x55C4, 0))
+
+    @staticmethod
+    def hdlr(handler: bytes, name: str) -> bytes:
+        return full_box(b"hdlr", 0, 0, struct.pack(">I4s12x", 0, handler), name.encode() + b"\x00")
+
+    @staticmethod
+    def dinf() -> bytes:
+        return box(b"dinf", full_box(b"dref", 0, 0, struct.pack(">I", 1), full_box(b"url ", 0, 1)))
+
+    @staticmethod
+    def stsz(sample_sizes: array) -> bytes:
+        if sample_sizes and sample_sizes.count(sample_sizes[0]) == len(sample_sizes):
+            return full_box(b"stsz", 0, 0, struct.pack(">II", sample_sizes[0], len(sample_sizes)))
+        return full_box(b"stsz", 0, 0, struct.pack(">II", 0, len(sample_sizes)), big_endian(sample_sizes))
+
+    @staticmethod
+    def aac_stsd(sample_rate: int, channels: int, bitrate: int) -> bytes:
+        """Sample description of AAC LC audio
+        args: bitrate = bit/s
+        """
+        rates: list[int] = [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000]
+        # AudioSpecificConfig: object type, sampling frequency index, channel configuration
+        config: bytes = struct.pack(">H", 2 << 11 | rates.index(sample_rate) << 7 | channels << 3)
+        decoder: bytes = struct.pack(">BB3xII", 0x40, 0x15, bitrate, bitrate) + b"\x05\x02" + config
+        descriptor: bytes = struct.pack(">HB", 1, 0) + b"\x04" + bytes([len(decoder)]) + decoder + b"\x06\x01\x02"
+        esds: bytes = full_box(b"esds", 0, 0, b"\x03" + bytes([len(descriptor)]) + descriptor)
+        return full_box(b"stsd", 0, 0, struct.pack(">I", 1),
+                        box(b"mp4a", bytes(6), struct.pack(">H8xHHHHI", 1, channels, 16, 0, 0, sample_rate << 16),
+                            esds))
+
+    @staticmethod
+    def tx3g() -> bytes:
+        """Timed text sample description of the chapter track"""
+        return box(b"tx3g", bytes(6), struct.pack(">H", 1),
+                   struct.pack(">IBB4B", 1, 0, 0, 0, 0, 0, 0),  # display flags, justification, background
+                   struct.pack(">4h", 0, 0, 0, 0),              # text box
+                   struct.pack(">HHHBB4B", 0, 0, 1, 0, 0, 0, 0, 0, 255),  # style record
+                   box(b"ftab", struct.pack(">HHB", 1, 1, 0)))
@@ -0,0 +1,284 @@
+from PySide6.QtCore import Qt, QAbstractItemModel, QModelIndex, QFileInfo
+from datetime import timedelta
+from collections import OrderedDict
+from audiobook import Audiobook
+from tracer import Tracer
+
+
+class BookNode():
+    """Audiobook row of the LibraryModel
+    args: key = audiobook key from library
+          data = audiobook dict, with files or only a file_count
+          node_id = internal id of its child indices
+    """
+    def __init__(self, key: str, data: dict, node_id: int) -> None:
+        self.key: str = key
+        self.node_id: int = node_id
+        self.row: int = -1
+        # files are None until the audiobook is expanded
+        self.files: list[dict] | None = data.pop("files", None)
+        self.file_count: int = data.pop("file_count", 0) if self.files is None else len(self.files)
+        self.data: dict = data
+
+
+class LibraryModel(QAbstractItemModel):
+    """Two level item model over the audiobook library
+    Top level rows are audiobooks, child rows their files. Top level indices have the
+    internal id 0, child indices the node_id of their audiobook.
+    Files are fetched from the library when an audiobook is expanded and released
+    again after it was collapsed once more than max_loaded_files are in memory.
+    """
+    BookRole: int = Qt.UserRole
+    FileRole: int = Qt.UserRole + 1
+    KeyRole: int = Qt.UserRole + 2
+    play_indicator: str = "\N{Black Right-Pointing Triangle} "
+    book_flags: Qt.ItemFlags = Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDropEnabled | Qt.ItemIsEditable
+    file_flags: Qt.ItemFlags = Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+
+    def __init__(self, data: dict, max_loaded_files: int = 20000) -> None:
+        super().__init__()
+        self.max_loaded_files: int = max_loaded_files
+        self.loaded_files: int = 0
+        # collapsed audiobooks with loaded files, least recently collapsed first
+        self.collapsed_keys: OrderedDict[str, None] = OrderedDict()
+        self.nodes: list[BookNode] = []
+        self.node_ids: dict[int, BookNode] = {}
+        self.node_keys: dict[str, BookNode] = {}
+        self.next_node_id: int = 1
+        self.export_count: int = 0
+        self.playing_file: str = ""
+        # replaces the audiobook counter while importing
+        self.status: str = ""
+        self.add_books(data)
+
+    # read
+    def node(self, index: QModelIndex) -> BookNode | None:
+        """Audiobook node of a top level or child index"""
+        if not index.isValid():
+            return None
+        if not index.internalId():
+            return self.nodes[index.row()]
+        return self.node_ids.get(index.internalId())
+
+    def book_index(self, audiobook_key: str, column: int = 0) -> QModelIndex:
+        """Top level index of an audiobook"""
+        node: BookNode | None = self.node_keys.get(audiobook_key)
+        if node is None:
+            return QModelIndex()
+        return self.index(node.row, column)
+
+    def index(self, row: int, column: int, parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, 0)
+        return self.createIndex(row, column, self.nodes[parent.row()].node_id)
+
+    def parent(self, index: QModelIndex = QModelIndex()) -> QModelIndex:
+        if not index.isValid() or not index.internalId():
+            return QModelIndex()
+        node: BookNode | None = self.node_ids.get(index.internalId())
+        if node is None:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, 0)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if not parent.isValid():
+            return len(self.nodes)
+        if parent.internalId() or parent.column():
+            return 0
+        return len(self.nodes[parent.row()].files or [])
+
+    def hasChildren(self, parent: QModelIndex = QModelIndex()) -> bool:
+        if not parent.isValid():
+            return bool(self.nodes)
+        if parent.internalId() or parent.column():
+            return False
+        return self.nodes[parent.row()].file_count > 0
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        if not parent.isValid() or parent.internalId() or parent.column():
+            return False
+        return self.nodes[parent.row()].files is None
+
+    def fetchMore(self, parent: QModelIndex) -> None:
+        """Load the files of an audiobook"""
+        if not self.canFetchMore(parent):
+            return
+        node: BookNode = self.nodes[parent.row()]
+        with Tracer.instance().span("fetch files", key=node.key):
+            files: list[dict] = Audiobook().read_files(node.key)
+        node.file_count = len(files)
+        if not files:
+            node.files = []
+            return
+        self.beginInsertRows(parent, 0, len(files) - 1)
+        node.files = files
+        self.loaded_files += len(files)
+        self.endInsertRows()
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 2
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return self.file_flags if index.internalId() else self.book_flags
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        node: BookNode | None = self.node(index)
+        if node is None:
+            return None
+        if role == self.KeyRole:
+            return node.key
+        if role == self.BookRole:
+            return node.data
+        if not index.internalId():
+            # audiobook rows are painted by the delegate
+            if role == Qt.DisplayRole and index.column() == 1:
+                return str(timedelta(seconds=node.data["duration"]))
+            return None
+        file: dict = node.files[index.row()]
+        if role == self.FileRole:
+            return file["file"]
+        if role == Qt.DisplayRole:
+            if index.column() == 1:
+                return str(timedelta(seconds=round(file["duration"])))
+            name: str = QFileInfo(file["file"]).fileName()
+            return f"{self.play_indicator}{name}" if file["file"] == self.playing_file else name
+        return None
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole):
+        if orientation != Qt.Horizontal or role != Qt.DisplayRole:
+            return None
+        return [self.status or f"Audiobook ({self.export_count}/{len(self.nodes)})", "Duration"][section]
+
+    def supportedDropActions(self) -> Qt.DropActions:
+        return Qt.MoveAction
+
+    # edit
+    def renumber(self) -> None:
+        """Update rows and export counter after rows were added or removed"""
+        for row, e_node in enumerate(self.nodes):
+            e_node.row = row
+        self.export_count = len([e for e in self.nodes if e.data["export"]])
+        self.headerDataChanged.emit(Qt.Horizontal, 0, 1)
+
+    def add_books(self, data: dict) -> None:
+        """Append audiobooks that are already in the library"""
+        if not data:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.nodes), len(self.nodes) + len(data) - 1)
+        for e_key, e_data in data.items():
+            node: BookNode = BookNode(e_key, e_data, self.next_node_id)
+            self.node_ids.update({node.node_id: node})
+            self.node_keys.update({node.key: node})
+            node.row = len(self.nodes)
+            self.nodes.append(node)
+            self.loaded_files += len(node.files or [])
+            self.next_node_id += 1
+        self.endInsertRows()
+        self.renumber()
+
+    def remove_books(self, audiobook_keys: list[str]) -> None:
+        """Remove audiobooks from model and library"""
+        for node in sorted([self.node_keys[e] for e in audiobook_keys if e in self.node_keys],
+                           key=lambda e: e.row, reverse=True):
+            self.beginRemoveRows(QModelIndex(), node.row, node.row)
+            self.nodes.pop(node.row)
+            self.node_ids.pop(node.node_id)
+            self.node_keys.pop(node.key)
+            self.collapsed_keys.pop(node.key, None)
+            self.loaded_files -= len(node.files or [])
+            for row, e_node in enumerate(self.nodes[node.row:], node.row):
+                e_node.row = row
+            self.endRemoveRows()
+        self.renumber()
+        Audiobook().delete_data(dict(audiobook_keys=audiobook_keys))
+
+    def remove_files(self, files: list[dict]) -> None:
+        """Remove files from model and library
+        args: files = [dict(audiobook_key, file)]
+        """
+        data: dict = Audiobook().delete_data(dict(files=files))
+        for e_key, e_data in data.items():
+            index: QModelIndex = self.book_index(e_key)
+            node: BookNode = self.node(index)
+            remaining: set[str] = set(e["file"] for e in e_data["files"])
+            for row in reversed(range(len(node.files or []))):
+                if node.files[row]["file"] in remaining:
+                    continue
+                self.beginRemoveRows(index, row, row)
+                node.files.pop(row)
+                self.loaded_files -= 1
+                self.endRemoveRows()
+            node.file_count = len(remaining)
+            node.data.update({"duration": e_data["duration"]})
+            self.dataChanged.emit(index, self.index(index.row(), 1))
+
+    def move_files(self, audiobook_key: str, rows: list[int], target_row: int) -> None:
+        """Move files of an audiobook to target_row and save the new order"""
+        index: QModelIndex = self.book_index(audiobook_key)
+        self.fetchMore(index)
+        node: BookNode = self.node(index)
+        files: list[dict] = [node.files[e_row] for e_row in sorted(rows)]
+        # target row without the moved files above it
+        target_row -= len([e_row for e_row in rows if e_row < target_row])
+        self.beginRemoveRows(index, 0, len(node.files) - 1)
+        book_files: list[dict] = node.files
+        node.files = []
+        self.endRemoveRows()
+        [book_files.remove(f_dict) for f_dict in files]
+        book_files[target_row:target_row] = files
+        self.beginInsertRows(index, 0, len(book_files) - 1)
+        node.files = book_files
+        self.endInsertRows()
+        Audiobook().update_data(audiobook_key, {"files": book_files})
+
+    def update_book(self, audiobook_key: str, fields: dict) -> None:
+        """Update audiobook fields in model and library"""
+        index: QModelIndex = self.book_index(audiobook_key)
+        node: BookNode | None = self.node(index)
+        if node is None:
+            return
+        node.data.update(fields)
+        Audiobook().update_data(audiobook_key, fields)
+        if "export" in fields:
+            self.renumber()
+        self.dataChanged.emit(index, self.index(index.row(), 1))
+
+    def set_status(self, status: str) -> None:
+        """Show a status instead of the audiobook counter, empty to reset"""
+        self.status = status
+        self.headerDataChanged.emit(Qt.Horizontal, 0, 1)
+
+    def set_playing(self, file: str) -> None:
+        """Mark the file that is currently played"""
+        changed: list[str] = [self.playing_file, file]
+        self.playing_file = file
+        for e_node in self.nodes:
+            for row, e_file in enumerate(e_node.files or []):
+                if e_file["file"] in changed:
+                    index: QModelIndex = self.index(row, 0, self.index(e_node.row, 0))
+                    self.dataChanged.emit(index, index)
+
+    def book_expanded(self, index: QModelIndex) -> None:
+        """Keep the files of an expanded audiobook"""
+        node: BookNode | None = self.node(index)
+        if node is not None:
+            self.collapsed_keys.pop(node.key, None)
+
+    def book_collapsed(self, index: QModelIndex) -> None:
+        """Release files of collapsed audiobooks while too many are loaded"""
+        node: BookNode | None = self.node(index)
+        if node is None or node.files is None:
+            return
+        self.collapsed_keys[node.key] = None
+        while self.loaded_files > self.max_loaded_files and self.collapsed_keys:
+            e_node: BookNode = self.node_keys[self.collapsed_keys.popitem(last=False)[0]]
+            if not e_node.files:
+                continue
+            self.beginRemoveRows(self.index(e_node.row, 0), 0, len(e_node.files) - 1)
+            self.loaded_files -= len(e_node.files)
+            e_node.files = None
+            self.endRemoveRows()
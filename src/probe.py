@@ -0,0 +1,260 @@
+import hashlib, mmap, os
+from typing import TYPE_CHECKING
+from probecache import ProbeCache
+from tracer import Tracer
+if TYPE_CHECKING:
+    from mutagen.mp3 import MPEGInfo
+
+
+class CoverHandle():
+    """Lazy access to the APIC cover of a mp3
+    args: path = mp3 file
+          digest = sha1 of the cover bytes, empty if the file has no cover
+          data = cover bytes if they are already in memory
+    """
+    def __init__(self, path: str, digest: str, data: bytes | None = None) -> None:
+        self.path: str = path
+        self.digest: str = digest
+        self._data: bytes | None = data
+
+    def __bool__(self) -> bool:
+        return bool(self.digest)
+
+    def release(self) -> None:
+        """Drop cover bytes from memory, read() loads them again"""
+        self._data = None
+
+    def read(self) -> bytes:
+        """Cover bytes, only the ID3 tag is read if they are not in memory"""
+        from mutagen.id3 import ID3
+        if self._data is None and self.digest:
+            tags: ID3 = ID3(self.path)
+            cover_key: list[str] = [key for key in tags if "APIC:" in key.upper()]
+            self._data = tags[cover_key[0]].data if cover_key else b""
+        return self._data or b""
+
+
+class FrameScan():
+    """MPEG audio frames of a memory mapped mp3, only their 4 byte headers are read
+    The exact duration is the sum of the samples of all frames, a Xing, Info or VBRI
+    frame in front of the audio is not counted.
+    args: data = mp3 bytes, usually a mmap
+    """
+    # (version, layer): kbit/s by bitrate index, version 2 includes 2.5
+    bitrates: dict[tuple[int, int], list[int]] = {
+        (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+        (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]}
+    # version bits: sample rates by index, None is reserved
+    sample_rates: list[list[int] | None] = [[11025, 12000, 8000], None, [22050, 24000, 16000], [44100, 48000, 32000]]
+
+    def __init__(self, data: bytes | mmap.mmap) -> None:
+        self.data: bytes | mmap.mmap = data
+        # header >> 9: frame length, samples, sample rate, bitrate, stream id
+        self.headers: dict[int, tuple[int, int, int, int, int] | None] = {}
+        # bitrates of the audio frames counted by duration
+        self.frame_bitrates: set[int] = set()
+
+    @staticmethod
+    def map(path: str) -> mmap.mmap | None:
+        """Read only memory map of a file, None if it is empty"""
+        with open(path, "rb") as mp3_file:
+            if not os.fstat(mp3_file.fileno()).st_size:
+                return None
+            return mmap.mmap(mp3_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def scan(cls, path: str) -> tuple[float, bool]:
+        """Exact duration in seconds, 0 if path has no MPEG audio frames,
+        and True if the frames have several bitrates
+        """
+        data: mmap.mmap | None = cls.map(path)
+        if data is None:
+            return 0, False
+        with data:
+            frame_scan: FrameScan = cls(data)
+            return frame_scan.duration(), len(frame_scan.frame_bitrates) > 1
+
+    @classmethod
+    def bitrate_changes(cls, path: str, bitrate: int) -> bool:
+        """True if frames spread over path have other bitrates than bitrate"""
+        data: mmap.mmap | None = cls.map(path)
+        if data is None:
+            return False
+        with data:
+            return bool(cls(data).sampled_bitrates() - {bitrate})
+
+    @classmethod
+    def parse(cls, word: int) -> tuple[int, int, int, int, int] | None:
+        """Frame length, samples, sample rate, bitrate and stream id of a frame header, None if invalid
+        the stream id is equal for the frames of a stream: version, layer and sample rate
+        """
+        if word >> 21 != 0x7ff:
+            return None
+        version, layer = word >> 19 & 3, 4 - (word >> 17 & 3)
+        bitrate_index, rate_index, padding = word >> 12 & 15, word >> 10 & 3, word >> 9 & 1
+        rates: list[int] | None = cls.sample_rates[version]
+        if rates is None or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+            return None
+        bitrate: int = cls.bitrates[(1 if version == 3 else 2, layer)][bitrate_index] * 1000
+        sample_rate: int = rates[rate_index]
+        stream: int = (word >> 17 & 15) << 2 | rate_index
+        if layer == 1:
+            return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, bitrate, stream
+        samples: int = 576 if layer == 3 and version != 3 else 1152
+        return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate, bitrate, stream
+
+    def header(self, offset: int) -> tuple[int, int, int, int, int] | None:
+        """Parsed frame header at offset"""
+        if offset + 4 > len(self.data):
+            return None
+        word: int = int.from_bytes(self.data[offset:offset + 4], "big")
+        key: int = word >> 9
+        if key not in self.headers:
+            self.headers.update({key: self.parse(word)})
+        return self.headers[key]
+
+    def audio_start(self) -> int:
+        """Offset behind the ID3v2 tags, players accept several in a row"""
+        offset: int = 0
+        while self.data[offset:offset + 3] == b"ID3" and offset + 10 <= len(self.data):
+            size: bytes = self.data[offset + 6:offset + 10]
+            footer: int = 10 if self.data[offset + 5] & 0x10 else 0
+            offset += 10 + footer + (size[0] << 21 | size[1] << 14 | size[2] << 7 | size[3])
+        return offset
+
+    def sync(self, offset: int, stream: int | None = None) -> int:
+        """Offset of the next frame from offset on that is followed by a second frame, -1 if none
+        args: stream = stream id both frames must have, any stream without
+        """
+        offset = self.data.find(b"\xff", offset)
+        while offset != -1:
+            frame: tuple[int, int, int, int, int] | None = self.header(offset)
+            if frame is not None and stream in (None, frame[4]):
+                following: tuple[int, int, int, int, int] | None = self.header(offset + frame[0])
+                if following is not None and following[4] == frame[4]:
+                    return offset
+            offset = self.data.find(b"\xff", offset + 1)
+        return -1
+
+    def vbr_header(self, offset: int, length: int) -> bool:
+        """True if the frame at offset is a Xing, Info or VBRI header instead of audio"""
+        frame: bytes = self.data[offset:offset + min(length, 64)]
+        return any(e in frame for e in (b"Xing", b"Info", b"VBRI"))
+
+    def duration(self) -> float:
+        """Seconds of all audio frames"""
+        offset: int = self.sync(self.audio_start())
+        if offset == -1:
+            return 0
+        first: tuple[int, int, int, int, int] = self.header(offset)
+        stream: int = first[4]
+        samples: int = 0
+        if self.vbr_header(offset, first[0]):
+            offset += first[0]
+        while offset != -1:
+            frame: tuple[int, int, int, int, int] | None = self.header(offset)
+            if frame is None or frame[4] != stream:
+                # garbage or tags between frames
+                offset = self.sync(offset + 1, stream)
+                continue
+            if offset + frame[0] > len(self.data):
+                # truncated last frame
+                break
+            samples += frame[1]
+            self.frame_bitrates.add(frame[3])
+            offset += frame[0]
+        return samples / first[2]
+
+    def sampled_bitrates(self, points: int = 8) -> set[int]:
+        """Bitrates of the frames found at points offsets spread over the file"""
+        start: int = self.audio_start()
+        bitrates: set[int] = set()
+        for point in range(points):
+            offset: int = self.sync(start + (len(self.data) - start) * point // points)
+            if offset != -1:
+                bitrates.add(self.header(offset)[3])
+        return bitrates
+
+
+class Probe():
+    """Read everything needed from a mp3 with a single open
+    Durations come from the stream header. Files whose header duration is only an estimate,
+    VBR without Xing or VBRI header or streams mutagen is unsure about, are flagged
+    suspicious and their frames are counted with FrameScan.
+    record: title, author, duration, bitrate, channels, sample_rate, vbr,
+            exact (duration from a frame scan), checked (probed by auto or exact, not fast), cover (sha1 digest) and cover_handle (CoverHandle)
+    args: cache = probe cache, the shared one without
+          mode = "auto" scans suspicious files, "fast" never scans, "exact" scans every file
+    """
+    modes: list[str] = ["auto", "fast", "exact"]
+
+    def __init__(self, cache: ProbeCache | None = None, mode: str = "auto") -> None:
+        self.cache: ProbeCache = cache if cache is not None else ProbeCache.instance()
+        self.mode: str = mode
+
+    def probe(self, path: str, keep_cover: bool = False) -> dict:
+        """Probe record from cache or file
+        args: keep_cover = keep cover bytes in memory instead of reading them lazily
+        """
+        record: dict | None = self.cache.get(path)
+        cover_data: bytes | None = None
+        # fast records were never checked for estimated durations
+        if record is not None and (self.mode == "exact" and not record["exact"] or
+                                   self.mode == "auto" and not record["checked"]):
+            record = None
+        if record is None:
+            with Tracer.instance().span("read tags", file=path):
+                record, cover_data = self.read(path)
+            self.cache.put(path, record)
+        record = dict(record)
+        record.update({"cover_handle": CoverHandle(path, record["cover"],
+                                                   cover_data if keep_cover else None)})
+        return record
+
+    def read(self, path: str) -> tuple[dict, bytes | None]:
+        """Parse tags, stream info and cover of a mp3"""
+        # mutagen is only loaded by imports, not at startup
+        from mutagen.mp3 import MP3, BitrateMode
+        audio_file: MP3 = MP3(path)
+        record: dict = {}
+        for key, e_tag in [["title", "TALB"], ["author", "TPE1"]]:
+            if not e_tag in audio_file:
+                record.update({key: ""})
+                continue
+            record.update({key: " ".join(audio_file[e_tag].text)})
+        length: float = audio_file.info.length
+        vbr: bool = audio_file.info.bitrate_mode in (BitrateMode.VBR, BitrateMode.ABR)
+        exact: bool = self.mode == "exact" or self.mode == "auto" and self.suspicious(path, audio_file.info)
+        if exact:
+            with Tracer.instance().span("scan frames", file=path):
+                seconds, bitrate_changes = FrameScan.scan(path)
+            length = seconds or length
+            vbr = vbr or bitrate_changes
+        record.update({"duration": round(length),
+                       "bitrate": audio_file.info.bitrate,
+                       "channels": audio_file.info.channels,
+                       "sample_rate": audio_file.info.sample_rate,
+                       "vbr": vbr,
+                       "exact": exact,
+                       "checked": self.mode != "fast"})
+        cover_key: list[str] = [key for key in audio_file if "APIC:" in key.upper()]
+        cover_data: bytes | None = audio_file[cover_key[0]].data if cover_key else None
+        record.update({"cover": hashlib.sha1(cover_data).hexdigest() if cover_data else ""})
+        return record, cover_data
+
+    @staticmethod
+    def suspicious(path: str, info: "MPEGInfo") -> bool:
+        """True if the header duration of a mp3 is an estimate from its size and first bitrate
+        Streams with a Xing, Info or VBRI header are exact, header-less ones are checked
+        for bitrate changes at a few frames over the file.
+        """
+        from mutagen.mp3 import BitrateMode
+        if info.sketchy:
+            return True
+        if info.bitrate_mode != BitrateMode.UNKNOWN:
+            return False
+        return FrameScan.bitrate_changes(path, info.bitrate)
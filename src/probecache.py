@@ -0,0 +1,85 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+from filekey import file_key
+from jsonio import JsonIO
+from tracer import Tracer
+
+
+class ProbeCache():
+    """Persistent cache of mp3 probe results
+    Entries are keyed by path and only valid while size and mtime_ns of the file match.
+    args: path = json cache file
+          max_entries = least recently used entries are evicted above this size
+    """
+    # bump when the probe record changes, older caches are dropped
+    version: int = 4
+    _instance: "ProbeCache | None" = None
+
+    def __init__(self, path: str = "", max_entries: int = 50000) -> None:
+        self.cache_path: str = path or os.path.dirname(os.path.realpath(__file__)) + "/probecache.json"
+        self.max_entries: int = max_entries
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+        self.dirty: bool = False
+        self.lock: Lock = Lock()
+        self.load()
+
+    @classmethod
+    def instance(cls, path: str = "") -> "ProbeCache":
+        """Shared cache, loaded once per process
+        args: path = json cache file, only used when the shared cache is created
+        """
+        if cls._instance is None:
+            cls._instance = cls(path)
+        return cls._instance
+
+    def load(self) -> None:
+        """Read cache from disk, a broken or missing cache starts empty"""
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            data: dict = JsonIO.read(self.cache_path)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != self.version:
+            return
+        self.entries = OrderedDict(data["entries"])
+
+    def save(self) -> None:
+        """Write cache to disk when it changed"""
+        # rewrites the whole json file, a few thousand entries take milliseconds
+        with self.lock:
+            if not self.dirty:
+                return
+            with Tracer.instance().span("save probe cache", entries=len(self.entries)):
+                JsonIO.write(dict(version=self.version, entries=dict(self.entries)),
+                             self.cache_path, indent=None)
+            self.dirty = False
+
+    def get(self, path: str) -> dict | None:
+        """Return cached meta data or None if missing or outdated"""
+        stat: list[int] = file_key(path)
+        with self.lock:
+            entry: dict | None = self.entries.get(path)
+            if entry is None:
+                return None
+            if entry["stat"] != stat:
+                # file changed since it was probed
+                self.entries.pop(path)
+                self.dirty = True
+                return None
+            # the recency order is saved, it decides what is evicted after a restart
+            self.entries.move_to_end(path)
+            self.dirty = True
+            return entry["meta_data"]
+
+    def put(self, path: str, meta_data: dict) -> None:
+        """Add meta data for the current version of the file"""
+        stat: list[int] = file_key(path)
+        with self.lock:
+            self.entries[path] = dict(stat=stat,
+                                      meta_data=meta_data)
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
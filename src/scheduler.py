@@ -0,0 +1,185 @@
+from collections.abc import Callable, Coroutine
+from threading import Lock
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    import asyncio
+    from asyncio.subprocess import Process
+
+
+class ExportJob():
+    """Export of an audiobook or audiobook part
+    args: key = export key of the audiobook
+          data = audiobook dict with files
+    """
+    def __init__(self, key: str, data: dict) -> None:
+        self.key: str = key
+        self.data: dict = data
+        # queued, running, done, cancelled, failed
+        self.state: str = "queued"
+        # running encoder processes of the job
+        self.processes: list["Process"] = []
+        self.encoded_files: int = 0
+        # inputs and settings of the export, empty if they could not be read
+        self.fingerprint: str = ""
+        # source files and settings only, equal if only tags or cover changed
+        self.audio_fingerprint: str = ""
+        self.error: Exception | None = None
+
+    @property
+    def cost(self) -> int:
+        """Jobs are ordered by their duration"""
+        return self.data["duration"]
+
+
+class ExportScheduler():
+    """Run export jobs longest first on a single asyncio loop
+    The queue can be paused, resumed, cancelled and reordered from other threads while it runs.
+    asyncio is imported by the methods running on the loop, the app starts without it.
+    Jobs start their encoders with process, which runs at most concurrency encoders at once.
+    args: run_job = coroutine function doing the export of a job
+          concurrency = number of jobs and encoder processes running at once
+    """
+    def __init__(self, run_job: Callable[[ExportJob], Coroutine], concurrency: int = 1) -> None:
+        self.run_job: Callable[[ExportJob], Coroutine] = run_job
+        self.concurrency: int = max(1, concurrency)
+        self.queue: list[ExportJob] = []
+        self.running: dict[ExportJob, "asyncio.Task"] = {}
+        self.jobs: list[ExportJob] = []
+        self.paused: bool = False
+        self.loop: "asyncio.AbstractEventLoop | None" = None
+        self.idle: "asyncio.Event | None" = None
+        self.slots: "asyncio.Semaphore | None" = None
+        # queue controls called while the loop is not running, applied when it starts
+        self.controls: list[tuple[Callable, tuple]] = []
+        self.lock: Lock = Lock()
+
+    def reset(self) -> None:
+        """Forget queue controls left from an earlier export"""
+        with self.lock:
+            self.controls.clear()
+
+    def run(self, jobs: list[ExportJob]) -> list[ExportJob]:
+        """Run jobs until the queue is empty, blocks the calling thread
+        controls called before the loop runs are applied to jobs first
+        """
+        import asyncio
+        self.paused = False
+        self.running = {}
+        self.jobs = list(jobs)
+        self.queue = sorted(self.jobs, key=lambda e: e.cost, reverse=True)
+        asyncio.run(self.main())
+        return self.jobs
+
+    async def main(self) -> None:
+        import asyncio
+        self.idle = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.concurrency)
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            controls: list[tuple[Callable, tuple]] = self.controls
+            self.controls = []
+        for function, args in controls:
+            function(*args)
+        self.schedule()
+        await self.idle.wait()
+        with self.lock:
+            self.loop = None
+
+    def schedule(self) -> None:
+        """Start queued jobs up to the concurrency limit"""
+        while not self.paused and self.queue and len(self.running) < self.concurrency:
+            job: ExportJob = self.queue.pop(0)
+            self.running.update({job: self.loop.create_task(self.run_one(job))})
+        if not self.queue and not self.running:
+            self.idle.set()
+
+    async def run_one(self, job: ExportJob) -> None:
+        import asyncio
+        job.state = "running"
+        try:
+            await self.run_job(job)
+            job.state = "done"
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            for process in job.processes:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+        except Exception as error:
+            job.state = "failed"
+            job.error = error
+        finally:
+            self.running.pop(job, None)
+            self.schedule()
+
+    async def process(self, job: ExportJob, *command: str,
+                      output: Callable[[str], None] | None = None) -> None:
+        """Run an encoder process of job once a slot is free
+        args: output = called with every line the process prints while it runs
+        """
+        import asyncio
+        from asyncio.subprocess import Process
+        async with self.slots:
+            process: Process = await asyncio.create_subprocess_exec(*command,
+                                                                    stdout=asyncio.subprocess.PIPE,
+                                                                    stderr=asyncio.subprocess.STDOUT)
+            job.processes.append(process)
+            rest: str = ""
+            # encoders may end progress lines with \r only
+            while data := await process.stdout.read(4096):
+                *lines, rest = (rest + data.decode(errors="replace")).replace("\r", "\n").split("\n")
+                for line in lines:
+                    if output is not None and line:
+                        output(line)
+            if output is not None and rest:
+                output(rest)
+            await process.wait()
+            job.processes.remove(process)
+
+    def call(self, function: Callable, *args) -> None:
+        """Run function on the loop thread, kept for the start of the next run if the loop is not running"""
+        with self.lock:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(function, *args)
+            else:
+                self.controls.append((function, args))
+
+    # queue control, safe to call from any thread
+    def pause(self) -> None:
+        """Don't start further jobs, running jobs finish"""
+        self.call(self._pause)
+
+    def resume(self) -> None:
+        """Start queued jobs again"""
+        self.call(self._resume)
+
+    def cancel(self, key: str = "") -> None:
+        """Cancel a queued or running job, all jobs without key"""
+        self.call(self._cancel, key)
+
+    def move(self, key: str, position: int) -> None:
+        """Move a queued job to position in the queue"""
+        self.call(self._move, key, position)
+
+    def _pause(self) -> None:
+        self.paused = True
+
+    def _resume(self) -> None:
+        self.paused = False
+        self.schedule()
+
+    def _cancel(self, key: str) -> None:
+        for job in [e for e in self.queue if not key or e.key == key]:
+            self.queue.remove(job)
+            job.state = "cancelled"
+        for job, task in list(self.running.items()):
+            if not key or job.key == key:
+                task.cancel()
+        self.schedule()
+
+    def _move(self, key: str, position: int) -> None:
+        for job in self.queue:
+            if job.key == key:
+                self.queue.remove(job)
+                self.queue.insert(max(0, position), job)
+                return
@@ -0,0 +1,64 @@
+class SplitPlanner():
+    """Split the files of an audiobook into the fewest parts of nearly equal duration
+    args: max_duration = longest part in seconds
+          max_size = largest projected part in bytes, 0 for no size limit
+    """
+    def __init__(self, max_duration: float, max_size: int = 0) -> None:
+        self.max_duration: float = max_duration
+        self.max_size: int = max_size
+
+    def limit(self, bitrate: int = 0) -> float:
+        """Longest part in seconds, shorter if the size limit needs it
+        args: bitrate = export bitrate in kbit/s
+        """
+        if not self.max_size or not bitrate:
+            return self.max_duration
+        return min(self.max_duration, self.max_size / (bitrate * 1000 / 8))
+
+    @staticmethod
+    def count(durations: list[float], limit: float) -> int:
+        """Number of parts when filling each part up to limit
+        a file longer than limit becomes a part of its own
+        """
+        parts: int = 1
+        duration: float = 0
+        for e_duration in durations:
+            if duration and duration + e_duration > limit:
+                parts += 1
+                duration = 0
+            duration += e_duration
+        return parts
+
+    def plan(self, files: list[dict], bitrate: int = 0) -> list[list[dict]]:
+        """Files of each part in their order"""
+        durations: list[float] = [e["duration"] for e in files]
+        if not durations:
+            return [files]
+        limit: float = max(self.limit(bitrate), max(durations))
+        return self.balance(files, self.count(durations, limit))
+
+    def balance(self, files: list[dict], parts: int) -> list[list[dict]]:
+        """Files of at most parts parts with the shortest possible longest part"""
+        durations: list[float] = [e["duration"] for e in files]
+        if parts <= 1 or len(files) <= 1:
+            return [files]
+        # smallest limit that still needs no more parts
+        low: float = max(sum(durations) / parts, max(durations))
+        high: float = sum(durations)
+        for _ in range(50):
+            if high - low < 0.5:
+                break
+            middle: float = (low + high) / 2
+            if self.count(durations, middle) <= parts:
+                high = middle
+            else:
+                low = middle
+        plan: list[list[dict]] = [[]]
+        duration: float = 0
+        for e_file in files:
+            if plan[-1] and duration + e_file["duration"] > high:
+                plan.append([])
+                duration = 0
+            plan[-1].append(e_file)
+            duration += e_file["duration"]
+        return plan
@@ -0,0 +1,59 @@
+from threading import Lock
+from typing import TYPE_CHECKING
+from coverstore import CoverStore
+if TYPE_CHECKING:
+    from mutagen.mp4 import MP4Cover
+
+
+class TagWriter():
+    """Write tags and cover of exported m4b files with a single save
+    Each cover is read and scaled once, all parts and jobs of an export share its bytes.
+    mutagen is loaded with the first tagged file, not when the app starts.
+    args: cover_size = longest cover edge in pixels, 0 keeps the cover size
+    """
+    def __init__(self, cover_size: int = 0) -> None:
+        self.cover_size: int = cover_size
+        # cover path: MP4Cover, None for unreadable covers
+        self.covers: dict[str, "MP4Cover | None"] = {}
+        self.lock: Lock = Lock()
+
+    def clear(self) -> None:
+        """Forget loaded covers, they may have changed since the last export"""
+        with self.lock:
+            self.covers.clear()
+
+    def cover(self, path: str) -> "MP4Cover | None":
+        """Cover bytes of a cover file, loaded on first use"""
+        with self.lock:
+            if path not in self.covers:
+                self.covers.update({path: self.load_cover(path)})
+            return self.covers[path]
+
+    def load_cover(self, path: str) -> "MP4Cover | None":
+        from mutagen.mp4 import MP4Cover
+        try:
+            data, extension = CoverStore.instance().read(path)
+        except OSError:
+            return None
+        if self.cover_size:
+            data = CoverStore.scaled(data, extension, self.cover_size)
+        return MP4Cover(data, MP4Cover.FORMAT_JPEG if extension == "jpg" else MP4Cover.FORMAT_PNG)
+
+    def write(self, path: str, data: dict) -> None:
+        """Save text tags and cover of an audiobook to m4b"""
+        from mutagen.mp4 import MP4
+        audio_file: MP4 = MP4(path)
+        if audio_file.tags is None:
+            audio_file.add_tags()
+        audio_file.tags.update({"\xa9nam": [data["title"]],
+                                "\xa9alb": [data["title"].split(" Part")[0]],
+                                "\xa9ART": [data["author"]],
+                                "\xa9gen": [data["genre"]],
+                                "trkn": [tuple(data["tracknumber"])]})
+        cover: "MP4Cover | None" = self.cover(data["cover"]) if data["cover"] else None
+        if cover is not None:
+            audio_file.tags["covr"] = [cover]
+        else:
+            # retagged exports may still have the removed cover
+            audio_file.tags.pop("covr", None)
+        audio_file.save()
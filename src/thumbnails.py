@@ -0,0 +1,149 @@
+import hashlib, os
+from collections import OrderedDict
+from threading import Lock
+from PySide6.QtCore import Qt, QSize, QBuffer, QByteArray, QIODevice, QThreadPool, QRunnable
+from PySide6.QtGui import QImage, QImageReader, QPixmap
+from audiobook import CostumSignals
+from filekey import file_key
+from jsonio import JsonIO
+
+
+class ThumbnailCache():
+    """Cover thumbnails decoded in a worker pool
+    Thumbnails are saved by sha1 of the cover bytes, an index maps cover paths to their
+    digest while size and mtime_ns of the file match, so known covers are never decoded again.
+    args: path = thumbnail directory
+          height = thumbnail height in pixels
+          max_pixmaps = least recently used pixmaps are dropped from memory above this size
+    """
+    # bump when thumbnails change, older indices are dropped
+    version: int = 1
+    _instance: "ThumbnailCache | None" = None
+
+    def __init__(self, path: str = "", height: int = 70, max_pixmaps: int = 500) -> None:
+        self.thumbnail_path: str = path or os.path.dirname(os.path.realpath(__file__)) + "/thumbnails"
+        self.index_path: str = self.thumbnail_path + "/index.json"
+        self.height: int = height
+        self.max_pixmaps: int = max_pixmaps
+        # path: dict(stat, digest, size)
+        self.entries: dict[str, dict] = {}
+        self.pixmaps: OrderedDict[str, QPixmap] = OrderedDict()
+        self.pending: set[str] = set()
+        self.dirty: bool = False
+        self.lock: Lock = Lock()
+        self.pool: QThreadPool = QThreadPool()
+        self.signals: CostumSignals = CostumSignals()
+        self.signals.thumbnail.connect(self.loaded)
+        self.load()
+
+    @classmethod
+    def instance(cls) -> "ThumbnailCache":
+        """Shared cache, created in the GUI thread"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def load(self) -> None:
+        """Read index from disk, a broken or missing index starts empty"""
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            data: dict = JsonIO.read(self.index_path)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != self.version:
+            return
+        self.entries = data["entries"]
+
+    def save(self) -> None:
+        """Write index to disk when it changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(self.thumbnail_path, exist_ok=True)
+            JsonIO.write(dict(version=self.version, entries=self.entries),
+                         self.index_path, indent=None)
+            self.dirty = False
+
+    def pixmap(self, path: str) -> QPixmap | None:
+        """Thumbnail of a cover or None while it is decoded, thumbnail_ready is
+        emitted with the path once it is available
+        """
+        pixmap: QPixmap | None = self.pixmaps.get(path)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(path)
+            return pixmap
+        if path and not path in self.pending:
+            self.pending.add(path)
+            self.pool.start(ThumbnailLoader(dict(path=path, cache=self)))
+        return None
+
+    def size(self, path: str) -> QSize:
+        """Size of the original cover, invalid if it is not decoded yet"""
+        with self.lock:
+            entry: dict | None = self.entries.get(path)
+        return QSize(*entry["size"]) if entry else QSize()
+
+    def loaded(self, path: str, image: QImage) -> None:
+        """Keep the thumbnail decoded by a ThumbnailLoader"""
+        self.pending.discard(path)
+        self.pixmaps.update({path: QPixmap.fromImage(image)})
+        self.pixmaps.move_to_end(path)
+        while len(self.pixmaps) > self.max_pixmaps:
+            self.pixmaps.popitem(last=False)
+        self.signals.thumbnail_ready.emit(path)
+
+    def thumbnail(self, path: str) -> QImage:
+        """Thumbnail from disk, the original is only decoded if it is unknown or changed"""
+        try:
+            stat: list[int] = file_key(path)
+        except OSError:
+            return QImage()
+        with self.lock:
+            entry: dict | None = self.entries.get(path)
+        if entry and entry["stat"] == stat:
+            image: QImage = QImage(f"{self.thumbnail_path}/{entry['digest']}.png")
+            if not image.isNull():
+                return image
+        with open(path, "rb") as cover_file:
+            data: bytes = cover_file.read()
+        digest: str = hashlib.sha1(data).hexdigest()
+        thumbnail_file: str = f"{self.thumbnail_path}/{digest}.png"
+        buffer: QBuffer = QBuffer()
+        buffer.setData(QByteArray(data))
+        buffer.open(QIODevice.ReadOnly)
+        reader: QImageReader = QImageReader(buffer)
+        size: QSize = reader.size()
+        image: QImage = QImage(thumbnail_file)
+        if image.isNull():
+            if size.isValid() and size.height() > self.height:
+                # decoders like jpeg scale while decoding
+                reader.setScaledSize(size.scaled(QSize(size.width() * self.height, self.height),
+                                                 Qt.KeepAspectRatio))
+            image = reader.read()
+            if image.isNull():
+                return image
+            if image.height() != self.height:
+                image = image.scaledToHeight(self.height, Qt.SmoothTransformation)
+            os.makedirs(self.thumbnail_path, exist_ok=True)
+            image.save(thumbnail_file)
+        with self.lock:
+            self.entries[path] = dict(stat=stat,
+                                      digest=digest,
+                                      size=[size.width(), size.height()])
+            self.dirty = True
+        return image
+
+
+class ThumbnailLoader(QRunnable):
+    """Run ThumbnailCache.thumbnail in its thread pool
+    args: path = cover image
+          cache = ThumbnailCache
+    """
+    def __init__(self, args: dict) -> None:
+        super().__init__()
+        self.args: dict = args
+
+    def run(self) -> None:
+        cache: ThumbnailCache = self.args["cache"]
+        cache.signals.thumbnail.emit(self.args["path"], cache.thumbnail(self.args["path"]))
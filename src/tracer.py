@@ -0,0 +1,105 @@
+import os, threading, time
+from contextlib import contextmanager, nullcontext
+from collections.abc import Iterator
+from jsonio import JsonIO
+
+
+class Tracer():
+    """Spans of the import and export pipelines as Chrome trace events
+    Tracing is off unless AUDIOBOOK_TRACE names the trace file or start is called,
+    span then costs a single attribute check. The trace opens in chrome://tracing
+    and ui.perfetto.dev with a timeline per thread.
+    args: path = trace file, tracing is off without it
+          max_events = later spans are dropped once the trace holds this many events
+    """
+    _instance: "Tracer | None" = None
+    # shared span of a disabled tracer
+    _off: nullcontext = nullcontext()
+
+    def __init__(self, path: str = "", max_events: int = 1000000) -> None:
+        self.path: str = ""
+        self.max_events: int = max_events
+        self.events: list[dict] = []
+        self.dropped: int = 0
+        self.started: float = time.perf_counter()
+        self.lock: threading.Lock = threading.Lock()
+        # track name: fake thread id of the track
+        self.tracks: dict[str, int] = {}
+        # threads named in the trace
+        self.threads: set[int] = set()
+        if path:
+            self.start(path)
+
+    @classmethod
+    def instance(cls) -> "Tracer":
+        """Shared tracer, on if AUDIOBOOK_TRACE is set"""
+        if cls._instance is None:
+            cls._instance = cls(os.environ.get("AUDIOBOOK_TRACE", ""))
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def start(self, path: str) -> None:
+        """Record spans until save writes them to path"""
+        self.path = os.path.abspath(path)
+        self.events.clear()
+        self.dropped = 0
+        self.tracks.clear()
+        self.threads.clear()
+        self.started = time.perf_counter()
+        self.metadata("process_name", os.getpid(), name="Audiobook Encoder")
+
+    def span(self, name: str, track: str = "", **args):
+        """Context manager timing a stage
+        args: track = own timeline for spans that overlap on one thread, like the jobs of the export loop
+              args = shown with the span, e.g. key and file
+        """
+        if not self.path:
+            return self._off
+        return self._span(name, track, args)
+
+    @contextmanager
+    def _span(self, name: str, track: str, args: dict) -> Iterator[None]:
+        tid: int = self.track(track) if track else self.thread()
+        started: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(dict(name=name, ph="X", pid=os.getpid(), tid=tid,
+                          ts=round((started - self.started) * 1e6, 1),
+                          dur=round((time.perf_counter() - started) * 1e6, 1), args=args))
+
+    def thread(self) -> int:
+        """Id of the calling thread, named in the trace by its first span"""
+        thread: threading.Thread = threading.current_thread()
+        with self.lock:
+            if thread.native_id not in self.threads:
+                self.threads.add(thread.native_id)
+                self.metadata("thread_name", thread.native_id, name=thread.name)
+        return thread.native_id
+
+    def track(self, name: str) -> int:
+        """Fake thread id of a named timeline"""
+        with self.lock:
+            if name not in self.tracks:
+                self.tracks.update({name: (1 << 30) + len(self.tracks)})
+                self.metadata("thread_name", self.tracks[name], name=name)
+            return self.tracks[name]
+
+    def metadata(self, kind: str, tid: int, **args) -> None:
+        self.events.append(dict(name=kind, ph="M", pid=os.getpid(), tid=tid, args=args))
+
+    def add(self, event: dict) -> None:
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        self.events.append(event)
+
+    def save(self) -> None:
+        """Write the trace file, spans recorded later are added by the next save"""
+        if not self.path:
+            return
+        JsonIO.write(dict(traceEvents=list(self.events), displayTimeUnit="ms",
+                          otherData=dict(dropped_events=self.dropped)), self.path, indent=None)
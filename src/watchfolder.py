@@ -0,0 +1,163 @@
+import os, time
+from collections import deque
+from collections.abc import Callable
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, QThreadPool, QUrl
+from audiobook import Audiobook, AudiobookImport, CostumSignals
+from library import Library
+
+
+class WatchFolder(QObject):
+    """Import and export the audiobook folders dropped into inbox folders
+    Every subfolder of an inbox is an audiobook, imported once its files did not change
+    for quiet_period seconds. Imports run one at a time with few tag readers and at most
+    max_queued imported audiobooks wait for their export, later folders stay in the inbox
+    until the queue has room. Bursts of new rips don't slow down running encoders.
+    args: inboxes = watched folders
+          quiet_period = seconds without changes before a folder is imported
+          max_queued = imported audiobooks waiting for their export
+          configure = called with the Audiobook of each export to set encoder, workers and signals
+          keep = keep exported audiobooks in the library
+    """
+    def __init__(self, inboxes: list[str], quiet_period: float = 30, max_queued: int = 4,
+                 configure: Callable[[Audiobook], None] | None = None, keep: bool = True) -> None:
+        super().__init__()
+        self.inboxes: list[str] = [os.path.abspath(e) for e in inboxes]
+        self.quiet_period: float = quiet_period
+        self.max_queued: int = max(1, max_queued)
+        self.configure: Callable[[Audiobook], None] | None = configure
+        self.keep: bool = keep
+        # tag readers of an import, the rest of the cores keep encoding
+        self.import_workers: int = 2
+        # Probe.modes of the imports
+        self.probe_mode: str = "auto"
+        self.signals: CostumSignals = CostumSignals()
+        # folder: [signature, monotonic time of its last change]
+        self.pending: dict[str, list] = {}
+        # folder: signature when it was imported
+        self.ingested: dict[str, list] = {}
+        self.importing: AudiobookImport | None = None
+        # audiobook keys waiting for the next export
+        self.queue: deque[str] = deque()
+        self.export: Audiobook | None = None
+        self.watcher: QFileSystemWatcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.scan)
+        self.timer: QTimer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+
+    def start(self) -> None:
+        """Watch the inboxes, folders already in them are imported too"""
+        for inbox in self.inboxes:
+            os.makedirs(inbox, exist_ok=True)
+        self.watcher.addPaths(self.inboxes)
+        for inbox in self.inboxes:
+            self.scan(inbox)
+        self.timer.start(1000)
+
+    def stop(self) -> None:
+        """Stop watching, a running export is cancelled and resumable"""
+        self.timer.stop()
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        if self.export is not None:
+            self.export.cancel_export()
+
+    @staticmethod
+    def signature(folder: str) -> list[int]:
+        """File count, total size and latest modification of the files in folder
+        links to folders are not followed like in the import walk, unreadable subfolders are left out
+        """
+        count: int = 0
+        size: int = 0
+        modified: int = 0
+        folders: list[str] = [folder]
+        while folders:
+            current: str = folders.pop()
+            try:
+                with os.scandir(current) as scan:
+                    entries: list[os.DirEntry] = list(scan)
+            except OSError:
+                # touch forgets a folder that is gone
+                if current == folder:
+                    raise
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.is_file():
+                    stat: os.stat_result = entry.stat()
+                    count += 1
+                    size += stat.st_size
+                    modified = max(modified, stat.st_mtime_ns)
+        return [count, size, modified]
+
+    def scan(self, path: str) -> None:
+        """Notice new and changed folders of an inbox or one of its folders"""
+        inbox: str = path if path in self.inboxes else os.path.dirname(path)
+        if not os.path.isdir(inbox):
+            return
+        with os.scandir(inbox) as entries:
+            folders: list[str] = [e.path for e in entries if e.is_dir() and not e.name.startswith(".")]
+        for folder in folders:
+            if folder not in self.watcher.directories():
+                self.watcher.addPath(folder)
+            self.touch(folder)
+
+    def touch(self, folder: str) -> None:
+        """Restart the quiet period of a folder if its files changed"""
+        try:
+            signature: list[int] = self.signature(folder)
+        except OSError:
+            self.pending.pop(folder, None)
+            return
+        if self.ingested.get(folder) == signature:
+            return
+        if folder not in self.pending or self.pending[folder][0] != signature:
+            self.pending.update({folder: [signature, time.monotonic()]})
+
+    def tick(self) -> None:
+        """Import the next quiet folder and start an export if none is running"""
+        for folder in list(self.pending):
+            self.touch(folder)
+        quiet: list[str] = [e_folder for e_folder, (signature, changed) in self.pending.items()
+                            if time.monotonic() - changed >= self.quiet_period]
+        if quiet and self.importing is None and len(self.queue) < self.max_queued:
+            self.start_import(min(quiet, key=lambda e: self.pending[e][1]))
+        if self.queue and self.export is None:
+            self.start_export()
+
+    def start_import(self, folder: str) -> None:
+        signature: list[int] = self.pending.pop(folder)[0]
+        self.importing = AudiobookImport(dict(paths=[QUrl.fromLocalFile(folder)]))
+        self.importing.audiobook.import_workers = self.import_workers
+        self.importing.audiobook.probe_mode = self.probe_mode
+        self.importing.signals.import_errors.connect(self.signals.import_errors.emit)
+        self.importing.signals.imported.connect(lambda data: self.import_finished(folder, signature, data))
+        QThreadPool.globalInstance().start(self.importing)
+
+    def import_finished(self, folder: str, signature: list[int], data: dict) -> None:
+        """Queue the imported audiobook, presets were applied by the import
+        failed folders are recorded too and only imported again once they change
+        """
+        self.importing = None
+        self.ingested.update({folder: signature})
+        key: str = list(data)[0] if data else ""
+        if key:
+            self.queue.append(key)
+        self.signals.folder_imported.emit(folder, key)
+        self.tick()
+
+    def start_export(self) -> None:
+        keys: list[str] = list(self.queue)
+        self.queue.clear()
+        self.export = Audiobook()
+        if self.configure is not None:
+            self.configure(self.export)
+        self.export.signals.unlock_ui.connect(lambda unlock: unlock and self.export_finished(keys))
+        self.export.export(keys=keys)
+
+    def export_finished(self, keys: list[str]) -> None:
+        self.export = None
+        if not self.keep:
+            Library.instance().delete_books(keys)
+        self.signals.folders_exported.emit(keys)
+        self.tick()
@@ -1,50 +1,101 @@
-from PySide6.QtWidgets import (QWidget, QTreeWidget, QAbstractItemView, QTreeWidgetItem,
+from PySide6.QtWidgets import (QWidget, QTreeView, QAbstractItemView, QStyledItemDelegate,
+                               QStyle, QStyleOptionButton, QApplication,
                                QLabel, QPushButton, QLineEdit, QComboBox, QFileDialog,
                                QMenu, QWidgetAction, QGridLayout, QDialog, QDialogButtonBox,
                                QPlainTextEdit, QProgressBar)
-from PySide6.QtGui import QPixmap, QImageWriter, QDesktopServices
-from PySide6.QtCore import Qt, QSize, QFileInfo, QStandardPaths, QUrl
-from datetime import timedelta
-from audiobook import Audiobook, Preset, AudioPlayer
-from typing import Self
+from PySide6.QtGui import QPixmap, QImageWriter, QDesktopServices, QPainter, QColor, QPen
+from PySide6.QtCore import (Qt, QSize, QRect, QFileInfo, QStandardPaths, QUrl, QThreadPool,
+                            QModelIndex, QPersistentModelIndex, QItemSelection, QItemSelectionModel)
+from audiobook import Audiobook, AudiobookImport, CoverResize, Preset
+from library import Library
+from models import LibraryModel
+from tracer import Tracer
+from thumbnails import ThumbnailCache
+from typing import Self, TYPE_CHECKING
 import os
+if TYPE_CHECKING:
+    from audioplayer import AudioPlayer
 
 
 
-class TreeWidget(QTreeWidget):
-    """Costum QTreeWidget"""
+class TreeView(QTreeView):
+    """Costum QTreeView over the LibraryModel
+    Audiobook rows are painted by the AudiobookDelegate, their editor widgets only exist
+    while the mouse is over the row or one of its inputs is in use.
+    """
     def __init__(self, args: dict) -> None:
         super().__init__()
         self.setGeometry(*args["geometry"])
-        self.setHeaderLabels(["Audiobook (0/0)", "Duration"])
+        # files are fetched when an audiobook is expanded
+        with Tracer.instance().span("load library"):
+            self.library_model: LibraryModel = LibraryModel(Audiobook().read_data(files=False))
+        self.setModel(self.library_model)
+        self.expanded.connect(self.library_model.book_expanded)
+        self.collapsed.connect(self.library_model.book_collapsed)
+        self.setItemDelegate(AudiobookDelegate(dict(parent=self,
+                                                    model=self.library_model)))
         self.header().setStretchLastSection(True)
         self.setAnimated(True)
         self.setAcceptDrops(True)
         self.setDragEnabled(True)
         self.setDragDropMode(QAbstractItemView.InternalMove)
         self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        # editor widgets follow the mouse
+        self.setMouseTracking(True)
+        self.entered.connect(self.open_editor)
+        self.editor_indices: list[QPersistentModelIndex] = []
         # help text
         self.help_text: QLabel = QLabel("Drag and Drop <br> Audiobooks", self)
         self.help_text.setStyleSheet("QLabel {font-size: 25px;\
                                               font-weight: bold;\
                                               qproperty-alignment: AlignCenter;\
                                               color: grey;}")
-        self.create_tree(Audiobook().read_data())
-        self.help_text.move(self.rect().center() - self.help_text.rect().center())
-        self.audio_player: AudioPlayer = AudioPlayer(self)
-        self.last_played_item: TreeWidgetItem | bool = False
+        self.library_model.headerDataChanged.connect(self.parent_item_counter_update)
+        self.parent_item_counter_update()
+        # created on the first preview, QtMultimedia is slow to load
+        self._audio_player: "AudioPlayer | None" = None
+        # running imports, kept alive until their results arrive
+        self.imports: list[AudiobookImport] = []
+
+    @property
+    def audio_player(self) -> "AudioPlayer":
+        """Player of the track previews"""
+        if self._audio_player is None:
+            from audioplayer import AudioPlayer
+            self._audio_player = AudioPlayer(self)
+        return self._audio_player
 
     def resizeEvent(self, event) -> None:
+        super().resizeEvent(event)
         self.help_text.move(self.rect().center() - self.help_text.rect().center())
 
+    def open_editor(self, index: QModelIndex) -> None:
+        """Open editor widgets of the audiobook row at index and close unused ones"""
+        if index.isValid() and not index.parent().isValid():
+            index = index.siblingAtColumn(0)
+            if not self.isPersistentEditorOpen(index):
+                self.openPersistentEditor(index)
+                self.editor_indices.append(QPersistentModelIndex(index))
+        for e_index in list(self.editor_indices):
+            if not e_index.isValid():
+                self.editor_indices.remove(e_index)
+                continue
+            editor: AudiobookEditor | None = self.indexWidget(QModelIndex(e_index))
+            if e_index == index or (editor and editor.is_busy()):
+                continue
+            self.closePersistentEditor(QModelIndex(e_index))
+            self.editor_indices.remove(e_index)
+
     def mouseDoubleClickEvent(self, event) -> None:
-        """Open file dialog when TreeWidget is double clicked or
-           expand / collapse TreeWidgetItem"""
+        """Open file dialog when TreeView is double clicked or
+           expand / collapse audiobook"""
         if not event.button() == Qt.LeftButton:
             return
-        if self.selectedItems():
-            select_item: TreeWidgetItem = self.selectedItems()[0]
-            select_item.setExpanded(True if not select_item.isExpanded() else False)
+        selected_rows: list[QModelIndex] = self.selectionModel().selectedRows()
+        if selected_rows:
+            self.setExpanded(selected_rows[0], not self.isExpanded(selected_rows[0]))
             return
         desktop_path: str = QStandardPaths.standardLocations(QStandardPaths.DesktopLocation)[0]
         audiobook_path: str = QFileDialog.getExistingDirectory(self.parent(), "Import audiobook...", desktop_path)
@@ -58,316 +109,384 @@ class TreeWidget(QTreeWidget):
             super().dragEnterEvent(event)
 
     def dragMoveEvent(self, event) -> None:
-        """Drag checks for external data or internal QTreewidgetItem movement"""
-        if self.selectedItems():
-            if isinstance(self.selectedItems()[0], TreeWidgetItem):
-                root_item: QTreeWidgetItem = self.invisibleRootItem()
-                # disable drop events for main treewidget
-                root_item.setFlags(root_item.flags() & ~Qt.ItemIsDropEnabled)
-                for parent_item_index in range(root_item.childCount()):
-                    parent_item: TreeWidgetItem = self.topLevelItem(parent_item_index)
-                    if parent_item == self.selectedItems()[0].parent():
-                        parent_item.setFlags(parent_item.flags() | Qt.ItemIsDropEnabled)
-                        continue
-                    # disable drop events to avoid moving items between parent items
-                    parent_item.setFlags(parent_item.flags() & ~Qt.ItemIsDropEnabled)
+        """Drag checks for external data or internal file movement"""
+        target: QModelIndex = self.indexAt(event.position().toPoint())
+        if event.mimeData().hasUrls():
+            # editor of the audiobook under the cursor accepts covers
+            self.open_editor(target)
+            event.acceptProposedAction()
+            return
         super().dragMoveEvent(event)
+        selected_rows: list[QModelIndex] = self.selectionModel().selectedRows()
+        # avoid moving files between audiobooks
+        if (not selected_rows or not target.isValid() or
+            target.data(LibraryModel.KeyRole) != selected_rows[0].data(LibraryModel.KeyRole)):
+            event.ignore()
 
     def dropEvent(self, event) -> None:
-        """Drop TreeItemWidgets, folders or files into widget"""
+        """Drop files inside their audiobook, folders or files into widget"""
         if event.mimeData().hasUrls():
+            event.acceptProposedAction()
             self.import_audiobook(event.mimeData().urls())
+            return
+        target: QModelIndex = self.indexAt(event.position().toPoint())
+        files: list[QModelIndex] = [e for e in self.selectionModel().selectedRows() if e.parent().isValid()]
+        if not files or not target.isValid():
+            event.ignore()
+            return
+        audiobook_key: str = files[0].data(LibraryModel.KeyRole)
+        if target.data(LibraryModel.KeyRole) != audiobook_key:
+            event.ignore()
+            return
+        if target.parent().isValid():
+            # dropped on a file
+            target_row: int = target.row()
+            if self.dropIndicatorPosition() == QAbstractItemView.BelowItem:
+                target_row += 1
+        elif self.dropIndicatorPosition() == QAbstractItemView.BelowItem:
+            # dropped below expanded audiobook
+            target_row: int = 0
         else:
-            items: TreeWidgetItem = self.selectedItems()
-            # get indices of selected QTreeWidgetItems before drop event
-            indices: int = [self.indexFromItem(i).row() for i in items]
-            super().dropEvent(event)
-            json_data: dict = Audiobook().read_data()
-            # get files from json by indices
-            files: list[dict] = [json_data[items[0].args["audiobook_key"]]["files"][index] for index in indices]
-            # delete files from json
-            [json_data[items[0].args["audiobook_key"]]["files"].remove(f_dict) for f_dict in files]
-            dropped_index: int = self.indexFromItem(items[0]).row()
-            # insert files in json at new QTreeWidget index
-            json_data[items[0].args["audiobook_key"]]["files"][dropped_index:dropped_index] = files
-            Audiobook().save_data(json_data)
+            target_row: int = self.library_model.rowCount(target)
+        self.library_model.move_files(audiobook_key, [e.row() for e in files], target_row)
+        # model moved the rows, the view must not remove them
+        event.setDropAction(Qt.IgnoreAction)
+        event.accept()
 
     def keyPressEvent(self, event) -> None:
-        parent_item_count: int = self.invisibleRootItem().childCount()
+        parent_item_count: int = self.library_model.rowCount()
+        selected_rows: list[QModelIndex] = self.selectionModel().selectedRows()
         # delete audiobooks or files
         if (event.modifiers() == Qt.ControlModifier and
             event.key() == Qt.Key_Backspace):
-                parent_items: list[str] = []
-                child_items: list[dict] = []
-                for each_item in self.selectedItems():
-                    if not each_item.text(0):
-                        # delete parent items
-                        self.invisibleRootItem().removeChild(each_item)
-                        parent_items.append(each_item.args["audiobook_key"])
-                        continue
-                    # delete child items
-                    each_item.parent().removeChild(each_item)
-                    child_items.append(dict(audiobook_key=each_item.args["audiobook_key"],
-                                            file=each_item.text(0)))
-                if parent_items:
-                    Audiobook().delete_data(dict(audiobook_keys=parent_items))
+                parent_items: list[str] = [e.data(LibraryModel.KeyRole) for e in selected_rows
+                                                                       if not e.parent().isValid()]
+                child_items: list[dict] = [dict(audiobook_key=e.data(LibraryModel.KeyRole),
+                                                file=e.data(LibraryModel.FileRole))
+                                           for e in selected_rows
+                                           if e.parent().isValid() and not e.data(LibraryModel.KeyRole) in parent_items]
                 if child_items:
-                    json_data: dict = Audiobook().delete_data(dict(files=child_items))
-                    self.parent_item_duration_update(json_data)
-                self.parent_item_counter_update()
-        # walk up the treewidget items
+                    self.library_model.remove_files(child_items)
+                if parent_items:
+                    self.library_model.remove_books(parent_items)
+        # walk up the treeview items
         if event.key() == Qt.Key_Up:
-            if self.selectedItems():
-                item_index: int = self.indexFromItem(self.selectedItems()[0]).row()
+            if selected_rows:
                 # when first parent item is selected go to last parent item
-                if (not item_index and
-                    self.selectedItems()[0].childCount()):
+                if (not selected_rows[0].row() and
+                    not selected_rows[0].parent().isValid()):
                         # select last item
-                        self.setCurrentItem(self.topLevelItem(parent_item_count-1))
+                        self.setCurrentIndex(self.library_model.index(parent_item_count-1, 0))
                         return
-                item_up: TreeWidgetItem = self.itemAbove(self.selectedItems()[0])
-                self.setCurrentItem(item_up)
-        # walk down the treewidget items
+                self.setCurrentIndex(self.indexAbove(selected_rows[0]))
+        # walk down the treeview items
         if event.key() == Qt.Key_Down:
-            if self.selectedItems():
-                item_index: int = self.indexFromItem(self.selectedItems()[0]).row()
+            if selected_rows:
                 # when the last parent item is selected go to first parent
-                if (self.selectedItems()[0].childCount() and
-                    not self.selectedItems()[0].isExpanded() and
-                    item_index == parent_item_count-1):
+                if (not selected_rows[0].parent().isValid() and
+                    not self.isExpanded(selected_rows[0]) and
+                    selected_rows[0].row() == parent_item_count-1):
                         # select first item
-                        self.setCurrentItem(self.topLevelItem(0))
+                        self.setCurrentIndex(self.library_model.index(0, 0))
                         return
+                item_down: QModelIndex = self.indexBelow(selected_rows[0])
                 # when last child item ist seleced go to first parent
-                if (not self.selectedItems()[0].childCount() and
-                    item_index == self.selectedItems()[0].parent().childCount()-1):
-                    item_down: TreeWidgetItem = self.itemBelow(self.selectedItems()[0])
-                    if not item_down:
-                        self.setCurrentItem(self.topLevelItem(0))
-                        return
-                item_down: TreeWidgetItem = self.itemBelow(self.selectedItems()[0])
-                self.setCurrentItem(item_down)
+                if not item_down.isValid():
+                    self.setCurrentIndex(self.library_model.index(0, 0))
+                    return
+                self.setCurrentIndex(item_down)
         # expand parent items
         if event.key() == Qt.Key_Right:
-            for each_item in self.selectedItems():
-                each_item.setExpanded(True)
+            for each_index in selected_rows:
+                self.setExpanded(each_index, True)
         # jump to root tree item and collapse items
         if event.key() == Qt.Key_Left:
-            selected_items: list[TreeWidgetItem] = self.selectedItems()
             self.clearSelection()
-            items_to_collapse: list[TreeWidgetItem] = []
-            for each_item in selected_items:
-                if each_item.text(0):
-                    # child item widgets
-                    items_to_collapse.append(each_item.parent())
+            for each_index in selected_rows:
+                if each_index.parent().isValid():
+                    # child items
+                    each_index = each_index.parent()
                 else:
-                    # parent item widgets
-                    items_to_collapse.append(each_item)
-                    each_item.setExpanded(False)
-                # select parent item widgets
-                for each_item_collapse in items_to_collapse:
-                    each_item_collapse.setSelected(True)
+                    # parent items
+                    self.setExpanded(each_index, False)
+                # select parent items
+                self.selectionModel().select(each_index, QItemSelectionModel.Select |
+                                                         QItemSelectionModel.Rows)
         # select all parent items cmd+a
         if (event.modifiers() == Qt.ControlModifier and
             event.key() == Qt.Key_A):
                 self.clearSelection()
-                for each_parent_item in range(parent_item_count):
-                    self.setCurrentItem(self.topLevelItem(each_parent_item))
+                if parent_item_count:
+                    selection: QItemSelection = QItemSelection(self.library_model.index(0, 0),
+                                                               self.library_model.index(parent_item_count-1, 1))
+                    self.selectionModel().select(selection, QItemSelectionModel.Select |
+                                                            QItemSelectionModel.Rows)
         # play or stop file playback
         if event.key() == Qt.Key_Space:
-            selected_items: list[TreeWidgetItem] = self.selectedItems()
-            if not selected_items or not "file" in selected_items[0].args:
+            if not selected_rows or not selected_rows[0].parent().isValid():
                 return
-            self.audio_player.play_audio(selected_items[0].args["file"])
-            # clean play indicator ui styling
-            if self.last_played_item:
-                revert_text: str = self.last_played_item.text(0).replace("\N{Black Right-Pointing Triangle} ", "")
-                self.last_played_item.setText(0, revert_text)
-            # set play indicator ui styling
-            if self.audio_player.playing_state:
-                text = f"\N{Black Right-Pointing Triangle} {selected_items[0].text(0)}"
-                selected_items[0].setText(0, text)
-                self.last_played_item = selected_items[0]
-
-    def add_parent_item(self, audiobook_key: str) -> QTreeWidgetItem:
-        """Add parent item, to QTreeWidget with user inputs"""
-        parent_item: TreeWidgetItem = TreeWidgetItem(dict(audiobook_key=audiobook_key,
-                                                          parent=self))
-        parent_item.setFlags(parent_item.flags() & ~Qt.ItemIsDragEnabled)
-        parent_item.add_user_inputs()
-        parent_item.setSizeHint(0, QSize(100, 100))
-        return parent_item
-
-    def add_child_item(self, args: dict) -> None:
-        """Add child item to parent item"""
-        child_item: TreeWidgetItem = TreeWidgetItem(args)
-        child_item.setFlags(child_item.flags() & ~Qt.ItemIsDropEnabled)
-        args["parent"].addChild(child_item)
-        child_item.set_text(args)
-
-    def create_tree(self, audiobook_data: dict) -> None:
-        """Populate QtreeWidget with parent and child items"""
-        for e_audiobook in audiobook_data:
-            # create parent item
-            audiobook: TreeWidgetItem = self.add_parent_item(e_audiobook)
-            # edit user inputs with audiobook_data infos
-            for input in audiobook.user_inputs:
-                if not input in audiobook_data[e_audiobook]:
-                    continue
-                input_widget: (TextField | BookCover |
-                               Label | ExportOptions | ToggleButton) = audiobook.user_inputs[input]
-                if isinstance(input_widget, ToggleButton):
-                    input_widget.args.update({"state": True if audiobook_data[e_audiobook][input] else False})
-                    input_widget.toggle_color()
-                    input_widget.args.update({"function": self.parent_item_counter_update})
-                elif isinstance(input_widget, BookCover):
-                    if not audiobook_data[e_audiobook][input]:
-                        continue
-                    input_widget.cover.load(audiobook_data[e_audiobook][input])
-                    input_widget.setPixmap(input_widget.cover.scaledToHeight(70, Qt.SmoothTransformation))
-                    input_widget.show_buttons(True)
-                elif isinstance(input_widget, TextField):
-                    input_widget.setText(audiobook_data[e_audiobook][input])
-                elif isinstance(input_widget, ExportOptions):
-                    input_widget.setCurrentIndex(audiobook_data[e_audiobook][input])
-                elif isinstance(input_widget, Label):
-                    input_widget.setText(str(timedelta(seconds=audiobook_data[e_audiobook][input])))
-            # add all files as children
-            for eFile in audiobook_data[e_audiobook]["files"]:
-                self.add_child_item(dict(parent=audiobook,
-                                         file=eFile["file"],
-                                         duration=eFile["duration"],
-                                         audiobook_key=e_audiobook))
-        self.parent_item_counter_update()
+            self.audio_player.play_audio(selected_rows[0].data(LibraryModel.FileRole))
+            # set play indicator
+            self.library_model.set_playing(selected_rows[0].data(LibraryModel.FileRole)
+                                           if self.audio_player.playing_state else "")
 
     def parent_item_counter_update(self) -> None:
-        """Update header active parent items counter"""
-        root_item: QTreeWidgetItem = self.invisibleRootItem()
-        parent_item_count: int = root_item.childCount()
-        if not parent_item_count:
+        """Show help text when the library is empty"""
+        if not self.library_model.rowCount():
             self.help_text.show()
             self.help_text.move(self.rect().center() - self.help_text.rect().center())
-            self.setHeaderLabels(["Audiobook (0/0)", "Duration"])
         else:
-            parent_item_active: int = len([root_item.child(i) for i in range(parent_item_count)
-                                                              if root_item.child(i).user_inputs["export"].args["state"]])
             self.help_text.hide()
-            self.setHeaderLabels([f"Audiobook ({parent_item_active}/{parent_item_count})", "Duration"])
-
-    def parent_item_duration_update(self, data: dict) -> None:
-        """Update all parent item durations"""
-        root_item: QTreeWidgetItem = self.invisibleRootItem()
-        for e_data in data.values():
-            for parent_item_index in range(root_item.childCount()):
-                parent_item: TreeWidgetItem = self.topLevelItem(parent_item_index)
-                if e_data["title"] in parent_item.user_inputs["title"].text():
-                    parent_item.user_inputs["duration"].setText(str(timedelta(seconds=e_data["duration"])))
 
     def import_audiobook(self, paths: list[QUrl]):
-        """Import audiobook from given paths"""
-        data: dict = Audiobook().get_data(paths)
+        """Import audiobook from given paths in a background thread"""
+        audiobook_import: AudiobookImport = AudiobookImport(dict(paths=paths))
+        audiobook_import.signals.import_progress.connect(self.import_progress)
+        audiobook_import.signals.import_errors.connect(self.import_errors)
+        audiobook_import.signals.imported.connect(lambda data: self.import_finished(audiobook_import, data))
+        self.imports.append(audiobook_import)
+        QThreadPool.globalInstance().start(audiobook_import)
+
+    def import_progress(self, done: int, found: int) -> None:
+        """Show import progress in header"""
+        self.help_text.hide()
+        self.library_model.set_status(f"Importing… ({done}/{found})")
+
+    def import_errors(self, errors: list[str]) -> None:
+        """Show the files an import skipped"""
+        Dialog(self).log_ui("Skipped unreadable files:\n" + "\n".join(errors))
+
+    def import_finished(self, audiobook_import: AudiobookImport, data: dict) -> None:
+        """Add imported audiobook to tree"""
+        self.imports.remove(audiobook_import)
+        self.library_model.set_status("")
         if not data:
+            self.parent_item_counter_update()
             Dialog(self).log_ui("Only MP3s are allowed. No files have been added.")
             return
-        self.create_tree(data)
+        with Tracer.instance().span("add to tree", keys=list(data)):
+            self.library_model.add_books(data)
 
 
-class TreeWidgetItem(QTreeWidgetItem):
-    """Costum QTreeWidgetItem
-    args: parent = QWidget
-          audiobook_key = audiobook key from json
+class AudiobookDelegate(QStyledItemDelegate):
+    """Paints audiobook rows like their editor widgets and creates
+    the AudiobookEditor only when the view asks for it
+    args: parent = TreeView
+          model = LibraryModel
     """
     def __init__(self, args: dict) -> None:
-        super().__init__()
-        self.setFlags(Qt.ItemIsEnabled |
-                      Qt.ItemIsSelectable |
-                      Qt.ItemIsDropEnabled |
-                      Qt.ItemIsDragEnabled)
-        # contains all user inputs
-        self.user_inputs: dict = {}
-        # contains parent and audiobook key
+        super().__init__(args["parent"])
         self.args: dict = args
+        self.quality_presets: list[str] = Audiobook.quality_presets
+        # covers are decoded in the background, repaint when one is ready
+        self.thumbnails: ThumbnailCache = ThumbnailCache.instance()
+        self.thumbnails.signals.thumbnail_ready.connect(lambda path: args["parent"].viewport().update())
+        self.background: QColor = QColor(200, 200, 200, 51)
+        self.toggle_colors: dict[bool, str] = {True: "#439871", False: "#c03d43"}
+
+    def sizeHint(self, option, index: QModelIndex) -> QSize:
+        if index.parent().isValid():
+            return super().sizeHint(option, index)
+        return QSize(100, 100)
+
+    def paint(self, painter: QPainter, option, index: QModelIndex) -> None:
+        if index.parent().isValid():
+            super().paint(painter, option, index)
+            return
+        book: dict = index.data(LibraryModel.BookRole)
+        rect: QRect = option.rect
+        at = lambda x, y, w, h: QRect(rect.x() + x, rect.y() + y, w, h)
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(rect, option.palette.highlight())
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(self.background)
+        if index.column() == 1:
+            # background rounded on the right, duration
+            background: QRect = rect.adjusted(0, 5, -5, -5)
+            painter.setClipRect(background)
+            painter.drawRoundedRect(background.adjusted(-20, 0, 0, 0), 10, 10)
+            painter.setClipping(False)
+            painter.setPen(option.palette.text().color())
+            painter.drawText(at(4, 40, 100, 20), Qt.AlignLeft | Qt.AlignVCenter, index.data())
+            painter.restore()
+            return
+        if self.args["parent"].isPersistentEditorOpen(index):
+            # editor widgets draw themselves
+            painter.restore()
+            return
+        # background and export toggle rounded on the left
+        background: QRect = rect.adjusted(0, 5, 0, -5)
+        painter.setClipRect(background)
+        painter.drawRoundedRect(background.adjusted(0, 0, 20, 0), 10, 10)
+        toggle: QRect = at(0, 5, 15, 90)
+        painter.setClipRect(toggle)
+        painter.setBrush(QColor(self.toggle_colors[bool(book["export"])]))
+        painter.drawRoundedRect(toggle.adjusted(0, 0, 20, 0), 10, 10)
+        painter.setClipping(False)
+        # cover
+        cover: QPixmap | None = self.thumbnails.pixmap(book["cover"]) if book["cover"] else QPixmap()
+        cover_rect: QRect = at(20, 10, 80, 80)
+        if cover is None:
+            # placeholder until the thumbnail is decoded
+            painter.drawRoundedRect(cover_rect.adjusted(5, 5, -5, -5), 10, 10)
+        elif not cover.isNull():
+            painter.setClipRect(cover_rect)
+            painter.drawPixmap(cover_rect.center().x() - cover.width() // 2,
+                               cover_rect.center().y() - cover.height() // 2, cover)
+            painter.setClipping(False)
+        else:
+            painter.setBrush(Qt.NoBrush)
+            painter.setPen(QPen(Qt.gray, 2, Qt.DashLine))
+            painter.drawRoundedRect(cover_rect.adjusted(1, 1, -1, -1), 10, 10)
+            font = painter.font()
+            font.setPixelSize(15)
+            painter.setFont(font)
+            painter.drawText(cover_rect, Qt.AlignCenter, "Drop\nCover")
+            painter.setFont(option.font)
+        # text fields and quality
+        fields: list[list] = [["Title", book["title"], at(110, 20, 270, 25)],
+                              ["Author", book["author"], at(390, 20, 270, 25)],
+                              ["", self.quality_presets[book["quality"]], at(110, 55, 270, 25)],
+                              ["Destination", book["destination"], at(390, 55, 270, 25)]]
+        for placeholder, text, field in fields:
+            painter.setBrush(Qt.NoBrush)
+            painter.setPen(QPen(Qt.gray, 1))
+            painter.drawRoundedRect(field, 5, 5)
+            painter.setPen(option.palette.text().color() if text else Qt.gray)
+            text_rect: QRect = field.adjusted(6, 0, -6, 0)
+            painter.drawText(text_rect, Qt.AlignLeft | Qt.AlignVCenter,
+                             option.fontMetrics.elidedText(text or placeholder, Qt.ElideRight, text_rect.width()))
+        # buttons
+        for name, button in [["\N{BLACK STAR}", at(665, 17, 25, 30)],
+                             ["\N{LOWER SEVEN EIGHTHS BLOCK}", at(665, 53, 25, 30)]]:
+            button_option: QStyleOptionButton = QStyleOptionButton()
+            button_option.rect = button
+            button_option.text = name
+            button_option.state = QStyle.State_Enabled | QStyle.State_Raised
+            QApplication.style().drawControl(QStyle.CE_PushButton, button_option, painter)
+        painter.restore()
+
+    def createEditor(self, parent: QWidget, option, index: QModelIndex) -> QWidget | None:
+        if index.parent().isValid() or index.column():
+            return None
+        return AudiobookEditor(dict(parent=parent,
+                                    audiobook_key=index.data(LibraryModel.KeyRole),
+                                    model=self.args["model"]))
+
+    def setEditorData(self, editor: QWidget, index: QModelIndex) -> None:
+        editor.set_data(index.data(LibraryModel.BookRole))
+
+    def setModelData(self, editor: QWidget, model: LibraryModel, index: QModelIndex) -> None:
+        """Editor inputs update the model themselves"""
+        pass
 
-    def set_text(self, args: dict) -> None:
-        """Set text for TreeWidgetItem childs
-        args:
-            file: str = filepath
-            duration: int = seconds
-        """
-        self.setText(0, QFileInfo(args["file"]).fileName())
-        self.setText(1, str(timedelta(seconds=round(args["duration"]))))
-
-    def add_user_inputs(self) -> None:
-        """Creates a prent TreeWidgetItem with user inputs"""
-        self.args["parent"].addTopLevelItem(self)
-        # qwidget sets scale and style for column 0 & 1
-        column0_style: QWidget = QWidget()
-        column0_style.setObjectName("c0")
-        column0_style.setStyleSheet("QWidget#c0 {background-color: rgba(200, 200, 200, 0.2);\
-                                                 border-top-left-radius: 10px;\
-                                                 border-bottom-left-radius: 10px;\
-                                                 margin: 5px 0px 5px 0px;}")
-        self.args["parent"].setItemWidget(self, 0, column0_style)
-        column1_style: QWidget = QWidget()
-        column1_style.setObjectName("c1")
-        column1_style.setStyleSheet("QWidget#c1 {background-color: rgba(200, 200, 200, 0.2);\
-                                                 border-top-right-radius: 10px;\
-                                                 border-bottom-right-radius: 10px;\
-                                                 margin: 5px 5px 5px 0px;}")
-        self.args["parent"].setItemWidget(self, 1, column1_style)
+    def updateEditorGeometry(self, editor: QWidget, option, index: QModelIndex) -> None:
+        editor.setGeometry(option.rect)
+
+
+class AudiobookEditor(QWidget):
+    """Editor widgets of one audiobook row
+    args: parent = QWidget
+          audiobook_key = audiobook key from library
+          model = LibraryModel
+    """
+    def __init__(self, args: dict) -> None:
+        super().__init__(args["parent"])
+        self.args: dict = args
+        self.setAttribute(Qt.WA_StyledBackground, True)
+        self.setObjectName("c0")
+        self.setStyleSheet("QWidget#c0 {background-color: rgba(200, 200, 200, 0.2);\
+                                        border-top-left-radius: 10px;\
+                                        border-bottom-left-radius: 10px;\
+                                        margin: 5px 0px 5px 0px;}")
         # audiobook user input editing widgets
         activate_export: ToggleButton = ToggleButton(dict(name="",
-                                                          parent=column0_style,
+                                                          parent=self,
                                                           geometry=[0, 0, 20, 100],
                                                           tip="Activate audiobook for export",
                                                           action="",
-                                                          audiobook_key=self.args["audiobook_key"]))
-        book_cover: BookCover = BookCover(dict(parent=column0_style,
-                                               audiobook_key=self.args["audiobook_key"]))
+                                                          audiobook_key=args["audiobook_key"],
+                                                          model=args["model"]))
+        book_cover: BookCover = BookCover(dict(parent=self,
+                                               audiobook_key=args["audiobook_key"],
+                                               model=args["model"]))
         book_title: TextField = TextField(dict(name="Title",
                                                tip="Title",
-                                               parent=column0_style,
+                                               parent=self,
                                                geometry=[110, 20, 270, 25],
-                                               audiobook_key=self.args["audiobook_key"]))
+                                               audiobook_key=args["audiobook_key"],
+                                               model=args["model"]))
         book_author: TextField = TextField(dict(name="Author",
                                                 tip="Author",
-                                                parent=column0_style,
+                                                parent=self,
                                                 geometry=[390, 20, 270, 25],
-                                                audiobook_key=self.args["audiobook_key"]))
-        book_presets: PushButton = PushButton(dict(name="\N{BLACK STAR}",
-                                                   parent=column0_style,
-                                                   geometry=[665, 17, 25, 30],
-                                                   tip="Apply author presets",
-                                                   action="author_preset",
-                                                   user_inputs=dict()))
-        book_quality: ExportOptions = ExportOptions(dict(options=Audiobook().quality_presets,
-                                                         parent=column0_style,
+                                                audiobook_key=args["audiobook_key"],
+                                                model=args["model"]))
+        self.book_presets: PushButton = PushButton(dict(name="\N{BLACK STAR}",
+                                                        parent=self,
+                                                        geometry=[665, 17, 25, 30],
+                                                        tip="Apply author presets",
+                                                        action="author_preset",
+                                                        user_inputs=dict()))
+        book_quality: ExportOptions = ExportOptions(dict(options=Audiobook.quality_presets,
+                                                         parent=self,
                                                          geometry=[110, 55, 270, 25],
-                                                         audiobook_key=self.args["audiobook_key"]))
+                                                         audiobook_key=args["audiobook_key"],
+                                                         model=args["model"]))
         book_export: TextField = TextField(dict(name="Destination",
                                                 tip="Export destination",
-                                                parent=column0_style,
+                                                parent=self,
                                                 geometry=[390, 55, 270, 25],
-                                                audiobook_key=self.args["audiobook_key"]))
+                                                audiobook_key=args["audiobook_key"],
+                                                model=args["model"]))
         file_browser: PushButton = PushButton(dict(name="\N{LOWER SEVEN EIGHTHS BLOCK}",
-                                                   parent=column0_style,
+                                                   parent=self,
                                                    geometry=[665, 53, 25, 30],
                                                    tip="Open file browser",
                                                    action="file_dialog",
                                                    user_inputs=dict(destination=book_export)))
-        book_duration: Label = Label(dict(text="Duration",
-                                          parent=column1_style,
-                                          geometry=[4, 40, 100, 20]))
         # add user input field for later edits
-        self.user_inputs.update({"export": activate_export,
-                                 "cover": book_cover,
-                                 "title": book_title,
-                                 "author": book_author,
-                                 "quality": book_quality,
-                                 "duration": book_duration,
-                                 "destination": book_export})
+        self.user_inputs: dict = {"export": activate_export,
+                                  "cover": book_cover,
+                                  "title": book_title,
+                                  "author": book_author,
+                                  "quality": book_quality,
+                                  "destination": book_export}
         # button needs ability to edit all user inputs
-        book_presets.args.update({"user_inputs": self.user_inputs})
+        self.book_presets.args.update({"user_inputs": self.user_inputs})
+
+    def set_data(self, audiobook_data: dict) -> None:
+        """Edit user inputs with audiobook infos"""
+        for input in self.user_inputs:
+            if not input in audiobook_data:
+                continue
+            input_widget: (TextField | BookCover |
+                           ExportOptions | ToggleButton) = self.user_inputs[input]
+            if isinstance(input_widget, ToggleButton):
+                input_widget.args.update({"state": True if audiobook_data[input] else False})
+                input_widget.toggle_color()
+            elif isinstance(input_widget, BookCover):
+                if not audiobook_data[input]:
+                    continue
+                input_widget.set_cover(audiobook_data[input])
+            elif (isinstance(input_widget, TextField) and
+                  input_widget.text() != audiobook_data[input]):
+                # values come from the library, don't write them back
+                input_widget.blockSignals(True)
+                input_widget.setText(audiobook_data[input])
+                input_widget.blockSignals(False)
+            elif isinstance(input_widget, ExportOptions):
+                input_widget.blockSignals(True)
+                input_widget.setCurrentIndex(audiobook_data[input])
+                input_widget.blockSignals(False)
+
+    def is_busy(self) -> bool:
+        """Editor has focus or an open popup and must stay open"""
+        return (self.isAncestorOf(QApplication.focusWidget()) or
+                self.book_presets.menu().isVisible() or
+                self.user_inputs["quality"].view().isVisible())
 
 
 class PushButton(QPushButton):
@@ -419,16 +538,30 @@ class PushButton(QPushButton):
 
     def export(self) -> None:
         """Export all Audiobooks"""
+        self.start_export(resume=False)
+
+    def resume_export(self) -> None:
+        """Continue the unfinished jobs of the last export"""
+        self.start_export(resume=True)
+
+    def start_export(self, resume: bool) -> None:
+        """Open the export dialog and run the export"""
         audiobook: Audiobook = Audiobook()
         # open export dialog
         dialog: Dialog = Dialog(self.args["parent"]).export_ui()
         # connect export signals to dialog
-        audiobook.signals.progress_range.connect(lambda: dialog.progressbar.setRange(0, audiobook.progress_range))
-        audiobook.signals.progress_value.connect(lambda: dialog.progressbar.setValue(audiobook.progress_value))
-        audiobook.signals.export_file.connect(lambda: dialog.text.appendPlainText(audiobook.export_file))
-        audiobook.signals.unlock_ui.connect(lambda: dialog.buttonbox.setEnabled(audiobook.unlock_ui))
+        # signals are queued, use their values instead of the current attributes
+        audiobook.signals.progress_range.connect(lambda p_range: dialog.progressbar.setRange(0, p_range))
+        audiobook.signals.progress_value.connect(dialog.progressbar.setValue)
+        audiobook.signals.export_file.connect(dialog.text.appendPlainText)
+        audiobook.signals.unlock_ui.connect(dialog.unlock_export)
+        dialog.cancel_button.clicked.connect(audiobook.cancel_export)
+        audiobook.signals.file_progress.connect(lambda title, done, total:
+                                                dialog.progressbar.setFormat(f"%p%  {title} ({done}/{total})"))
+        audiobook.signals.throughput.connect(lambda seconds, files:
+                                             dialog.throughput.setText(f"{seconds:.1f}x realtime, {files:.1f} files/min"))
         # export function
-        audiobook.export()
+        audiobook.export(resume)
 
     def file_dialog(self) -> None:
         """Show a system file dialog and set user input to select path"""
@@ -457,14 +590,14 @@ class PresetMenu(QMenu):
         self.clear()
         self.addAction("Save", self.save_author_preset)
         self.addSeparator()
-        # get presets from json
+        # get presets from library
         for each_preset in sorted(Preset().read_data()):
             self.addAction(PresetWidgetAction(dict(parent=self,
                                                    name=each_preset,
                                                    user_inputs=self.args["user_inputs"])))
 
     def save_author_preset(self) -> None:
-        """Save user infomation from input widgets into json"""
+        """Save user infomation from input widgets into library"""
         Preset().get_data(dict(author=self.args["user_inputs"]["author"].text(),
                                destination=self.args["user_inputs"]["destination"].text(),
                                quality=self.args["user_inputs"]["quality"].currentIndex()))
@@ -513,7 +646,7 @@ class PresetWidgetAction(QWidgetAction):
                     widget.setCurrentIndex(value)
 
     def delete_author_preset(self) -> None:
-        """Delete preset from json and QMenu"""
+        """Delete preset from library and QMenu"""
         Preset().delete_data(self.args["name"])
         self.deleteLater()
 
@@ -523,9 +656,9 @@ class ToggleButton(QPushButton):
     args: parent = QWidget
           geometry = [x, y, w, h]
           name = displayed text
-          audiobook_key = audiobook key from json
+          audiobook_key = audiobook key from library
+          model = LibraryModel
           state = toggle state of button
-          function = function to call
     """
     def __init__(self, args: dict) -> None:
         super().__init__()
@@ -540,8 +673,7 @@ class ToggleButton(QPushButton):
                             QPushButton:hover {background-color: #43be71;}")
         self.setToolTip(args["tip"])
         self.args: dict = args
-        self.args.update({"state": True,
-                          "function": None})
+        self.args.update({"state": True})
         self.colors: dict ={True: ["#439871", "#43be71"],
                             False: ["#c03d43", "#ff3d43"]}
         # Signals
@@ -555,15 +687,10 @@ class ToggleButton(QPushButton):
 
 
     def toggle(self) -> None:
-        """Update toggle state of button, change color, json and audiobook counter"""
-        data: dict = Audiobook().read_data()
-        audiobook_index: str = self.args["audiobook_key"]
-        toggle_state: bool = data[audiobook_index]["export"]
-        data[audiobook_index].update({"export": False if toggle_state else True})
-        self.args["state"] = False if toggle_state else True
+        """Update toggle state of button, change color, library and audiobook counter"""
+        self.args["state"] = False if self.args["state"] else True
         self.toggle_color()
-        self.args["function"]()
-        Audiobook().save_data(data)
+        self.args["model"].update_book(self.args["audiobook_key"], {"export": self.args["state"]})
 
 
 class Label(QLabel):
@@ -583,7 +710,8 @@ class Label(QLabel):
 class BookCover(QLabel):
     """Costum QLabel to display artwork
     args: parent = QWidget
-          audiobook_key = audiobook key from json
+          audiobook_key = audiobook key from library
+          model = LibraryModel
     """
     def __init__(self, args: dict) -> None:
         super().__init__()
@@ -603,7 +731,10 @@ class BookCover(QLabel):
                                         border-radius: 10px;}\
                             PushButton:hover {background-color: #ff3d43;}")
         self.setAcceptDrops(True)
-        self.cover: QPixmap = QPixmap()
+        # path of the displayed cover, its thumbnail is decoded in the background
+        self.cover: str = ""
+        self.thumbnails: ThumbnailCache = ThumbnailCache.instance()
+        self.thumbnails.signals.thumbnail_ready.connect(self.thumbnail_ready)
         # buttons are visible when cover image is displayed
         self.delete_button: PushButton = PushButton(dict(parent=self,
                                                          geometry=[60, 0, 20, 20],
@@ -623,24 +754,44 @@ class BookCover(QLabel):
     def show_buttons(self, state: bool) -> None:
         """Set button visibility"""
         self.delete_button.setVisible(state)
-        if not self.cover.isNull():
-            state = True if self.cover.width() % self.cover.height() else False
+        size: QSize = self.thumbnails.size(self.cover)
+        if state and size.isValid():
+            state = True if size.width() % size.height() else False
         self.resize_button.setVisible(state)
 
+    def set_cover(self, path: str) -> None:
+        """Display the thumbnail of a cover as soon as it is decoded"""
+        self.cover = path
+        thumbnail: QPixmap | None = self.thumbnails.pixmap(path)
+        if thumbnail is None:
+            self.clear()
+            self.show_buttons(False)
+            return
+        self.setPixmap(thumbnail)
+        self.show_buttons(True)
+
+    def thumbnail_ready(self, path: str) -> None:
+        if path == self.cover:
+            self.set_cover(path)
+
     def delete_cover(self) -> None:
         """Delete active cover image"""
-        Audiobook().delete_data(dict(cover="Delete",
-                                     audiobook_key=self.args["audiobook_key"]))
-        self.cover = QPixmap()
+        self.args["model"].update_book(self.args["audiobook_key"], {"cover": ""})
+        self.cover = ""
         self.show_buttons(False)
         self.setText(self.cover_text)
 
     def resize_cover(self) -> None:
-        """Squares 1:1 cover image"""
-        path: str = Audiobook().resize_cover(self.args["audiobook_key"])
-        self.cover.load(path)
-        self.setPixmap(self.cover.scaledToHeight(70, Qt.SmoothTransformation))
-        self.show_buttons(True)
+        """Squares 1:1 cover image in a background thread"""
+        cover_resize: CoverResize = CoverResize(dict(audiobook_key=self.args["audiobook_key"]))
+        cover_resize.signals.cover_resized.connect(self.cover_resized)
+        self.resize_button.setVisible(False)
+        QThreadPool.globalInstance().start(cover_resize)
+
+    def cover_resized(self, path: str) -> None:
+        """Show the squared cover"""
+        self.set_cover(path)
+        self.args["model"].update_book(self.args["audiobook_key"], {"cover": path})
 
     def dragEnterEvent(self, event) -> None:
         if event.mimeData().hasUrls():
@@ -658,14 +809,9 @@ class BookCover(QLabel):
                     Dialog(self.args["parent"]).log_ui(f"\"{format.upper()}\"\
                                                          is not a supported file format.\n\n{path}")
                     continue
-                self.cover.load(path)
-                self.setPixmap(self.cover.scaledToHeight(70, Qt.SmoothTransformation))
                 event.acceptProposedAction()
-                audiobook_index: str = self.args["audiobook_key"]
-                data: dict = Audiobook().read_data()
-                data[audiobook_index].update({"cover": path})
-                self.show_buttons(True)
-                Audiobook().save_data(data)
+                self.set_cover(path)
+                self.args["model"].update_book(self.args["audiobook_key"], {"cover": path})
         else:
             super().dropEvent(event)
 
@@ -676,7 +822,8 @@ class TextField(QLineEdit):
           geometry = [x, y, w, h]
           name = displayed text
           tip = displayed tooltip
-          audiobook_key = audiobook key from json
+          audiobook_key = audiobook key from library
+          model = LibraryModel
     """
     def __init__(self, args: dict) -> None:
         super().__init__()
@@ -693,10 +840,13 @@ class TextField(QLineEdit):
         # Signals
         self.textChanged.connect(self.text_edited)
 
+    def focusOutEvent(self, event) -> None:
+        """Write pending edits when the user leaves the field"""
+        Library.instance().flush()
+        super().focusOutEvent(event)
+
     def text_edited(self) -> None:
         """User is editing textfields"""
-        data: dict = Audiobook().read_data()
-        audiobook_index: str = self.args["audiobook_key"]
         audiobook_input: str = self.args["name"].lower()
         if "title" in audiobook_input:
             cursor_position: int = self.cursorPosition()
@@ -704,8 +854,7 @@ class TextField(QLineEdit):
             self.setText("".join("-" if i in "\/|<>*#'´`^°" else i for i in self.text()))
             # set cursor to editing position, curser position is reseted after setText()
             self.setCursorPosition(cursor_position)
-        data[audiobook_index].update({audiobook_input: self.text()})
-        Audiobook().save_data(data)
+        self.args["model"].update_book(self.args["audiobook_key"], {audiobook_input: self.text()})
 
 
 class ExportOptions(QComboBox):
@@ -713,7 +862,8 @@ class ExportOptions(QComboBox):
     args: parent = QWidget
           geometry = [x, y, w, h]
           tip = displayed tooltip
-          audiobook_key = audiobook key from json
+          audiobook_key = audiobook key from library
+          model = LibraryModel
           options = list of quality options
     """
     def __init__(self, args: dict) -> None:
@@ -732,11 +882,8 @@ class ExportOptions(QComboBox):
         self.currentIndexChanged.connect(self.index_changed)
 
     def index_changed(self) -> None:
-        """Update json when index is changed"""
-        audiobook_index: str = self.args["audiobook_key"]
-        data: dict = Audiobook().read_data()
-        data[audiobook_index].update({"quality": self.currentIndex()})
-        Audiobook().save_data(data)
+        """Update library when index is changed"""
+        self.args["model"].update_book(self.args["audiobook_key"], {"quality": self.currentIndex()})
 
 
 class Dialog(QDialog):
@@ -766,14 +913,22 @@ class Dialog(QDialog):
         """Export dialog"""
         self.setWindowTitle("Export Audiobooks")
         self.setFixedSize(700, 400)
-        self.buttonbox.setEnabled(False)
+        self.cancel_button: QPushButton = self.buttonbox.addButton("Cancel", QDialogButtonBox.ActionRole)
+        self.unlock_export(False)
         self.progressbar: QProgressBar = QProgressBar()
+        self.throughput: QLabel = QLabel()
         self.grid_layout.addWidget(self.progressbar, 0, 0)
-        self.grid_layout.addWidget(self.text, 1, 0)
-        self.grid_layout.addWidget(self.buttonbox, 2, 0)
+        self.grid_layout.addWidget(self.throughput, 1, 0)
+        self.grid_layout.addWidget(self.text, 2, 0)
+        self.grid_layout.addWidget(self.buttonbox, 3, 0)
         self.open()
         return self
 
+    def unlock_export(self, unlock: bool) -> None:
+        """Close the export dialog after the export, cancel it while it runs"""
+        self.buttonbox.button(QDialogButtonBox.Close).setEnabled(unlock)
+        self.cancel_button.setEnabled(not unlock)
+
     def about_ui(self, args: dict) -> Self:
         """App About dialog"""
         self.setStyleSheet("QLabel {color: grey;\
@@ -806,7 +961,7 @@ class Dialog(QDialog):
         return self
 
     def keyPressEvent(self, event) -> None:
-        if self.buttonbox.isEnabled():
+        if self.buttonbox.button(QDialogButtonBox.Close).isEnabled():
             if event.key() == Qt.Key_Escape:
                 self.close()
 